@@ -0,0 +1,97 @@
+import sqlite3
+import hashlib
+import json
+import os
+import threading
+import time
+
+class AIResponseCache:
+    """Cache persistente das respostas da IA, com remoção LRU e prazo de validade"""
+
+    def __init__(self, db_path=None, max_entradas=1000, ttl_segundos=24 * 3600):
+        # Guardar a cache ao lado de tasks.db
+        if db_path is None:
+            if not os.path.exists('data'):
+                os.makedirs('data')
+            db_path = os.path.abspath(os.path.join('data', 'ai_cache.db'))
+
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.hits = 0
+        self.misses = 0
+
+        # Uma só conexão partilhada pelas threads da IA, protegida por um lock
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode = WAL')
+        self.conn.execute('PRAGMA synchronous = NORMAL')
+        self.conn.execute('''
+            CREATE TABLE IF NOT EXISTS respostas (
+                chave TEXT PRIMARY KEY,
+                resposta TEXT NOT NULL,
+                criado_em REAL NOT NULL,
+                acedido_em REAL NOT NULL
+            )
+        ''')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_respostas_acesso ON respostas(acedido_em)')
+        self.conn.commit()
+
+    @staticmethod
+    def chave(modelo, mensagens, temperatura, max_tokens=None):
+        """Calcula a chave de um pedido a partir do modelo, das mensagens e dos parâmetros"""
+        conteudo = json.dumps([modelo, mensagens, temperatura, max_tokens],
+                              ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+    def obter(self, chave):
+        """Retorna a resposta guardada para a chave, ou None se não existir ou tiver expirado"""
+        agora = time.time()
+        with self._lock:
+            linha = self.conn.execute(
+                'SELECT resposta, criado_em FROM respostas WHERE chave = ?', (chave,)
+            ).fetchone()
+            if linha is None or agora - linha[1] > self.ttl_segundos:
+                if linha is not None:
+                    self.conn.execute('DELETE FROM respostas WHERE chave = ?', (chave,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+
+            self.conn.execute('UPDATE respostas SET acedido_em = ? WHERE chave = ?', (agora, chave))
+            self.conn.commit()
+            self.hits += 1
+            return linha[0]
+
+    def guardar(self, chave, resposta):
+        """Guarda uma resposta e remove as menos usadas recentemente acima do limite"""
+        agora = time.time()
+        with self._lock:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO respostas (chave, resposta, criado_em, acedido_em)
+                VALUES (?, ?, ?, ?)
+            ''', (chave, resposta, agora, agora))
+            self.conn.execute('''
+                DELETE FROM respostas WHERE chave IN (
+                    SELECT chave FROM respostas
+                    ORDER BY acedido_em DESC
+                    LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entradas,))
+            self.conn.commit()
+
+    def estatisticas(self):
+        """Retorna os contadores de acertos e falhas e o número de entradas"""
+        with self._lock:
+            entradas = self.conn.execute('SELECT COUNT(*) FROM respostas').fetchone()[0]
+        return {'hits': self.hits, 'misses': self.misses, 'entradas': entradas}
+
+    def limpar(self):
+        """Remove todas as respostas guardadas"""
+        with self._lock:
+            self.conn.execute('DELETE FROM respostas')
+            self.conn.commit()
+
+    def fechar(self):
+        """Fecha a conexão da cache"""
+        with self._lock:
+            self.conn.close()
@@ -1,18 +1,360 @@
 import os
+import random
+import threading
+import time
 from dotenv import load_dotenv
 import groq
+import httpx
 import json
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
 from datetime import datetime, timedelta
+from ai_cache import AIResponseCache
 
 # Carregar variáveis de ambiente
 load_dotenv()
 
-class AITaskAnalyzer:
-    def __init__(self):
+# Configuração partilhada por todos os pedidos à IA (pode ser alterada no .env)
+MODELO_IA = os.getenv('GROQ_MODEL', "mixtral-8x7b-32768")
+MAX_PEDIDOS_IA = int(os.getenv('GROQ_MAX_PEDIDOS', '4'))
+# Tempo (s) que uma conexão sem uso fica aberta para ser reutilizada pelo pedido seguinte
+KEEPALIVE_IA = float(os.getenv('GROQ_KEEPALIVE', '60'))
+# Tempo máximo (s) que o utilizador espera por uma resposta, incluindo as novas tentativas
+PRAZO_IA = float(os.getenv('GROQ_PRAZO', '15'))
+MAX_TENTATIVAS_IA = int(os.getenv('GROQ_TENTATIVAS', '3'))
+# Se a resposta demorar mais do que isto (s), é feito um segundo pedido igual em paralelo (0 desliga)
+ATRASO_HEDGE_IA = float(os.getenv('GROQ_HEDGE', '0'))
+# Limite de pedidos por minuto aceite pela conta da API
+PEDIDOS_MINUTO_IA = int(os.getenv('GROQ_PEDIDOS_MINUTO', '30'))
+
+# Valores que a IA pode sugerir para uma tarefa
+CATEGORIAS_IA = ('Trabalho', 'Estudos', 'Pessoal')
+PRIORIDADES_IA = ('Alta', 'Média', 'Baixa')
+
+# Erros passageiros: vale a pena tentar de novo e contam como falhas para o disjuntor
+ERROS_TEMPORARIOS = (groq.APIConnectionError, groq.RateLimitError, groq.InternalServerError, TimeoutError)
+
+class IAIndisponivel(Exception):
+    """A API está marcada como indisponível e o pedido nem chegou a ser feito"""
+
+class EsperaLocalEsgotada(TimeoutError):
+    """O prazo acabou na fila local (taxa ou vaga), antes de o pedido chegar à API"""
+
+class DisjuntorIA:
+    """Disjuntor dos pedidos à IA.
+
+    Depois de max_falhas falhas seguidas abre e recusa os pedidos durante `pausa` segundos;
+    passado esse tempo deixa passar um pedido de teste, que o fecha se correr bem.
+    """
+
+    def __init__(self, max_falhas=5, pausa=30):
+        self.max_falhas = max_falhas
+        self.pausa = pausa
+        self._falhas = 0
+        self._aberto_ate = None
+        self._em_teste = False
+        self._lock = threading.Lock()
+
+    def verificar(self):
+        """Lança IAIndisponivel se o disjuntor estiver aberto"""
+        with self._lock:
+            if self._aberto_ate is None:
+                return
+            if time.monotonic() < self._aberto_ate or self._em_teste:
+                raise IAIndisponivel("Serviço de IA temporariamente indisponível")
+            self._em_teste = True
+
+    def registar_sucesso(self):
+        with self._lock:
+            self._falhas = 0
+            self._aberto_ate = None
+            self._em_teste = False
+
+    def libertar_teste(self):
+        """Liberta o pedido de teste que terminou sem dizer nada sobre o estado da API"""
+        with self._lock:
+            self._em_teste = False
+
+    def registar_falha(self):
+        with self._lock:
+            self._falhas += 1
+            if self._em_teste or self._falhas >= self.max_falhas:
+                self._aberto_ate = time.monotonic() + self.pausa
+            self._em_teste = False
+
+class LimitadorTaxa:
+    """Balde de fichas que limita o número de pedidos por minuto"""
+
+    def __init__(self, pedidos_por_minuto):
+        self.capacidade = pedidos_por_minuto
+        self.intervalo = 60 / pedidos_por_minuto
+        self._fichas = float(pedidos_por_minuto)
+        self._atualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _repor(self, agora):
+        self._fichas = min(self.capacidade, self._fichas + (agora - self._atualizado) / self.intervalo)
+        self._atualizado = agora
+
+    def obter(self, limite):
+        """Espera por uma ficha; retorna False se ela só chegasse depois do limite"""
+        with self._lock:
+            agora = time.monotonic()
+            self._repor(agora)
+            # A ficha fica reservada já, para os pedidos seguintes esperarem pela vez deles
+            espera = max(0, 1 - self._fichas) * self.intervalo
+            if agora + espera > limite:
+                return False
+            self._fichas -= 1
+        if espera:
+            time.sleep(espera)
+        return True
+
+    def tentar_obter(self):
+        """Retira uma ficha apenas se houver uma disponível agora"""
+        with self._lock:
+            self._repor(time.monotonic())
+            if self._fichas < 1:
+                return False
+            self._fichas -= 1
+            return True
+
+class ClienteIA:
+    """Cliente Groq partilhado: uma pool de conexões HTTP persistentes e um limite de pedidos em curso.
+
+    Cada pedido tem um prazo total; os erros passageiros são repetidos com espera exponencial
+    aleatória dentro desse prazo e, enquanto a API falhar, o disjuntor recusa logo os pedidos.
+    """
+
+    def __init__(self, api_key=None, modelo=None, max_pedidos=None, keepalive=None,
+                 prazo=None, max_tentativas=None, atraso_hedge=None, disjuntor=None,
+                 pedidos_por_minuto=None):
+        self.modelo = modelo or MODELO_IA
+        self.max_pedidos = max_pedidos or MAX_PEDIDOS_IA
+        self.prazo = prazo or PRAZO_IA
+        self.max_tentativas = max_tentativas or MAX_TENTATIVAS_IA
+        self.atraso_hedge = ATRASO_HEDGE_IA if atraso_hedge is None else atraso_hedge
+        self.espera_base = 0.5
+        self.espera_maxima = 4
+        self.disjuntor = disjuntor if disjuntor is not None else DisjuntorIA()
+        self._taxa = LimitadorTaxa(pedidos_por_minuto or PEDIDOS_MINUTO_IA)
+        # Pedidos acima do limite esperam por uma vaga em vez de abrirem mais conexões
+        self._semaforo = threading.BoundedSemaphore(self.max_pedidos)
+        # Cada pedido em curso tem a sua vaga, por isso há sempre uma thread livre para ele
+        self._executor = ThreadPoolExecutor(max_workers=self.max_pedidos, thread_name_prefix='groq')
+        # Uma só pool HTTP: as conexões (e o handshake TLS) são reutilizadas entre pedidos
+        self._http = httpx.Client(limits=httpx.Limits(
+            max_connections=self.max_pedidos,
+            max_keepalive_connections=self.max_pedidos,
+            keepalive_expiry=keepalive or KEEPALIVE_IA
+        ))
+        # As novas tentativas são feitas aqui, dentro do prazo, e não pelo SDK
         self.client = groq.Groq(
-            api_key=os.getenv('GROQ_API_KEY')
+            api_key=api_key or os.getenv('GROQ_API_KEY'),
+            http_client=self._http,
+            max_retries=0
         )
-        self.model = "mixtral-8x7b-32768"  # Mudando para um modelo mais estável
+
+    def _ocupar_vaga(self, limite):
+        """Espera pela vez na taxa de pedidos e por uma vaga, até ao limite do prazo"""
+        if not self._taxa.obter(limite):
+            raise EsperaLocalEsgotada("Prazo do pedido à IA esgotado à espera da taxa de pedidos")
+        restante = limite - time.monotonic()
+        if restante <= 0 or not self._semaforo.acquire(timeout=restante):
+            raise EsperaLocalEsgotada("Prazo do pedido à IA esgotado à espera de vaga")
+
+    def _chamar(self, pedido, limite):
+        """Faz um pedido com a vaga já ocupada, libertando-a no fim"""
+        try:
+            chat_completion = self.client.chat.completions.create(
+                **pedido, timeout=max(limite - time.monotonic(), 0.1))
+            return chat_completion.choices[0].message.content
+        finally:
+            self._semaforo.release()
+
+    def _tentar(self, pedido, limite):
+        """Uma tentativa, limitada pelo prazo; com hedge, repete o pedido se a resposta tardar"""
+        self._ocupar_vaga(limite)
+        pendentes = {self._executor.submit(self._chamar, pedido, limite)}
+        if self.atraso_hedge:
+            feitos, _ = wait(pendentes, timeout=min(self.atraso_hedge, max(limite - time.monotonic(), 0)))
+            # O pedido extra só avança se houver uma vaga livre e taxa disponível nesse momento
+            if not feitos and time.monotonic() < limite and self._semaforo.acquire(blocking=False):
+                if self._taxa.tentar_obter():
+                    pendentes.add(self._executor.submit(self._chamar, pedido, limite))
+                else:
+                    self._semaforo.release()
+
+        erro = None
+        while pendentes:
+            feitos, pendentes = wait(pendentes, timeout=max(limite - time.monotonic(), 0),
+                                     return_when=FIRST_COMPLETED)
+            if not feitos:
+                break
+            for future in feitos:
+                if future.exception() is None:
+                    return future.result()
+                erro = future.exception()
+        if erro is not None and not pendentes:
+            raise erro
+        raise TimeoutError("Prazo do pedido à IA esgotado")
+
+    def _esperar_nova_tentativa(self, tentativa, limite):
+        """Espera antes da tentativa seguinte; retorna False se já não houver tempo ou tentativas"""
+        if tentativa >= self.max_tentativas:
+            return False
+        espera = random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** (tentativa - 1)))
+        if time.monotonic() + espera >= limite:
+            return False
+        time.sleep(espera)
+        return True
+
+    def criar(self, mensagens, temperature=0.1, max_tokens=1000, prazo=None):
+        """Faz um pedido de chat e retorna o texto da resposta, dentro do prazo (s) indicado"""
+        limite = time.monotonic() + (prazo or self.prazo)
+        pedido = dict(messages=mensagens, model=self.modelo,
+                      temperature=temperature, max_tokens=max_tokens)
+        tentativa = 0
+        while True:
+            self.disjuntor.verificar()
+            tentativa += 1
+            try:
+                resposta = self._tentar(pedido, limite)
+            except EsperaLocalEsgotada:
+                # A espera foi na fila local: não diz nada sobre o estado da API
+                self.disjuntor.libertar_teste()
+                raise
+            except ERROS_TEMPORARIOS:
+                self.disjuntor.registar_falha()
+                if not self._esperar_nova_tentativa(tentativa, limite):
+                    raise
+            except groq.APIStatusError:
+                # A API respondeu (por exemplo 400 ou 401): está disponível, o pedido é que falhou
+                self.disjuntor.registar_sucesso()
+                raise
+            except BaseException:
+                self.disjuntor.libertar_teste()
+                raise
+            else:
+                self.disjuntor.registar_sucesso()
+                return resposta
+
+    def transmitir(self, mensagens, temperature=0.1, max_tokens=1000, prazo=None):
+        """Faz um pedido de chat em stream e produz as partes do texto à medida que chegam.
+
+        O prazo limita a espera pela primeira parte; só se tenta de novo enquanto nada foi recebido.
+        """
+        limite = time.monotonic() + (prazo or self.prazo)
+        tentativa = 0
+        while True:
+            self.disjuntor.verificar()
+            tentativa += 1
+            recebido = False
+            try:
+                self._ocupar_vaga(limite)
+                # A vaga fica ocupada enquanto a resposta estiver a ser recebida, e o stream é
+                # fechado mesmo que a leitura pare a meio, para a ligação voltar à pool
+                try:
+                    with self.client.chat.completions.create(
+                        messages=mensagens,
+                        model=self.modelo,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        timeout=max(limite - time.monotonic(), 0.1)
+                    ) as stream:
+                        for chunk in stream:
+                            if not chunk.choices:
+                                continue
+                            parte = chunk.choices[0].delta.content
+                            if parte:
+                                recebido = True
+                                yield parte
+                finally:
+                    self._semaforo.release()
+            except EsperaLocalEsgotada:
+                self.disjuntor.libertar_teste()
+                raise
+            except ERROS_TEMPORARIOS:
+                self.disjuntor.registar_falha()
+                if recebido or not self._esperar_nova_tentativa(tentativa, limite):
+                    raise
+            except groq.APIStatusError:
+                self.disjuntor.registar_sucesso()
+                raise
+            except BaseException:
+                # Inclui o GeneratorExit de quem deixa de ler a resposta a meio
+                self.disjuntor.libertar_teste()
+                raise
+            else:
+                self.disjuntor.registar_sucesso()
+                return
+
+    def fechar(self):
+        """Fecha as conexões abertas da pool"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._http.close()
+
+_cliente_partilhado = None
+_lock_cliente = threading.Lock()
+
+def obter_cliente_ia():
+    """Retorna o cliente da IA partilhado pela aplicação, criando-o no primeiro uso"""
+    global _cliente_partilhado
+    with _lock_cliente:
+        if _cliente_partilhado is None:
+            _cliente_partilhado = ClienteIA()
+        return _cliente_partilhado
+
+class AITaskAnalyzer:
+    def __init__(self, cache=None, cliente=None):
+        # Todos os métodos usam o mesmo cliente, modelo e pool de conexões
+        self.cliente = cliente if cliente is not None else obter_cliente_ia()
+        self.model = self.cliente.modelo
+        # Respostas JSON já obtidas para o mesmo pedido são reutilizadas
+        self.cache = cache if cache is not None else AIResponseCache()
+        # Limites do contexto enviado: só as tarefas mais relevantes, dentro de um orçamento
+        self.max_tarefas_contexto = 10
+        self.max_tokens_contexto = 1500
+        # Categorização em lote: tarefas por pedido, orçamento do pedido e prazo de cada lote
+        self.max_tarefas_lote = 25
+        self.max_tokens_lote = 2000
+        self.max_caracteres_descricao_lote = 200
+        self.tokens_resposta_tarefa = 30
+        self.prazo_lote = 60
+
+    def _limitar_contexto(self, linhas):
+        """Mantém as primeiras linhas que cabem no orçamento de tokens do contexto"""
+        # Estimativa conservadora de ~4 caracteres por token
+        orcamento = self.max_tokens_contexto * 4
+        selecionadas = []
+        for linha in linhas[:self.max_tarefas_contexto]:
+            orcamento -= len(linha) + 1
+            if orcamento < 0:
+                break
+            selecionadas.append(linha)
+        return "\n".join(selecionadas)
+
+    @staticmethod
+    def _formatar_resumo(resumo):
+        """Formata o resumo das tarefas numa linha compacta"""
+        if not resumo:
+            return ""
+        estados = ", ".join(f"{estado or 'sem estado'}: {total}" for estado, total in resumo['por_estado'].items())
+        prioridades = ", ".join(f"{prioridade or 'sem prioridade'}: {total}" for prioridade, total in resumo['por_prioridade'].items())
+        return f"Resumo: {resumo['total']} tarefas (estados - {estados}; prioridades - {prioridades})"
+
+    def _pedir_json(self, mensagens, temperature=0.1, max_tokens=1000, prazo=None):
+        """Pede uma resposta JSON à API, reutilizando a resposta em cache para pedidos iguais"""
+        chave = self.cache.chave(self.model, mensagens, temperature, max_tokens)
+        resposta = self.cache.obter(chave)
+        if resposta is not None:
+            return json.loads(resposta)
+
+        resposta = self.cliente.criar(mensagens, temperature, max_tokens, prazo=prazo).strip()
+        # Só respostas JSON válidas chegam à cache
+        dados = json.loads(resposta)
+        self.cache.guardar(chave, resposta)
+        return dados
 
     def _formatar_resposta_padrao(self):
         """Retorna uma resposta padrão em caso de erro"""
@@ -43,12 +385,21 @@ class AITaskAnalyzer:
             "recomendacoes": ["Adicione mais contexto", "Estabeleça métricas de conclusão"]
         }
 
-    def analisar_tarefa(self, titulo, descricao, tarefas_existentes=None):
-        """Analisa uma nova tarefa e sugere prioridade, categoria e verifica similaridades"""
-        # Preparar contexto
-        contexto_tarefas = ""
+    def analisar_tarefa(self, titulo, descricao, tarefas_existentes=None, resumo=None, tarefas_similares=None):
+        """Analisa uma nova tarefa e sugere prioridade, categoria e verifica similaridades.
+
+        Se tarefas_similares for dado (já calculado localmente), a IA não é questionada sobre
+        elas e a lista é devolvida tal como veio.
+        """
+        # Preparar contexto: tarefas existentes mais relevantes primeiro, dentro do orçamento
+        contexto_tarefas = self._formatar_resumo(resumo)
         if tarefas_existentes:
-            contexto_tarefas = "\n".join([f"- {t['titulo']}: {t.get('descricao', '')}" for t in tarefas_existentes])
+            contexto_tarefas += "\n" + self._limitar_contexto(
+                [f"- {t['titulo']}: {t.get('descricao', '')}" for t in tarefas_existentes])
+
+        campo_similares = ''
+        if tarefas_similares is None:
+            campo_similares = '\n            "tarefas_similares": ["tarefa1", "tarefa2"],'
 
         prompt = f"""
         Você é um assistente de gestão de tarefas. Analise a seguinte tarefa e forneça recomendações.
@@ -64,8 +415,7 @@ class AITaskAnalyzer:
         {{
             "prioridade": "Alta|Média|Baixa",
             "categoria": "Trabalho|Estudos|Pessoal",
-            "data_vencimento": "YYYY-MM-DD",
-            "tarefas_similares": ["tarefa1", "tarefa2"],
+            "data_vencimento": "YYYY-MM-DD",{campo_similares}
             "justificativas": {{
                 "prioridade": "razão da prioridade escolhida",
                 "categoria": "razão da categoria escolhida",
@@ -75,8 +425,8 @@ class AITaskAnalyzer:
         """
 
         try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
+            analise = self._pedir_json(
+                [
                     {
                         "role": "system",
                         "content": "Você é um assistente especializado em análise de tarefas. Responda APENAS com JSON válido, sem texto adicional."
@@ -86,23 +436,19 @@ class AITaskAnalyzer:
                         "content": prompt
                     }
                 ],
-                model=self.model,
                 temperature=0.1,  # Reduzindo a temperatura para respostas mais consistentes
                 max_tokens=1000
             )
-
-            resposta = chat_completion.choices[0].message.content.strip()
-            try:
-                # Tentar processar a resposta como JSON
-                return json.loads(resposta)
-            except json.JSONDecodeError as e:
-                print(f"Erro ao decodificar JSON: {str(e)}")
-                print(f"Resposta recebida: {resposta}")
-                return self._formatar_resposta_padrao()
-
+        except json.JSONDecodeError as e:
+            print(f"Erro ao decodificar JSON: {str(e)}")
+            print(f"Resposta recebida: {e.doc}")
+            analise = self._formatar_resposta_padrao()
         except Exception as e:
             print(f"Erro na análise da tarefa: {str(e)}")
-            return self._formatar_resposta_padrao()
+            analise = self._formatar_resposta_padrao()
+        if tarefas_similares is not None:
+            analise['tarefas_similares'] = tarefas_similares
+        return analise
 
     def sugerir_melhorias(self, tarefa):
         """Sugere melhorias para uma tarefa existente"""
@@ -130,8 +476,8 @@ class AITaskAnalyzer:
         """
 
         try:
-            chat_completion = self.client.chat.completions.create(
-                messages=[
+            return self._pedir_json(
+                [
                     {
                         "role": "system",
                         "content": "Você é um assistente especializado em otimização de tarefas. Responda APENAS com JSON válido, sem texto adicional."
@@ -141,36 +487,129 @@ class AITaskAnalyzer:
                         "content": prompt
                     }
                 ],
-                model=self.model,
                 temperature=0.1,
                 max_tokens=1000
             )
-
-            resposta = chat_completion.choices[0].message.content.strip()
-            try:
-                # Tentar processar a resposta como JSON
-                return json.loads(resposta)
-            except json.JSONDecodeError as e:
-                print(f"Erro ao decodificar JSON: {str(e)}")
-                print(f"Resposta recebida: {resposta}")
-                return self._formatar_resposta_melhoria_padrao(tarefa)
-
+        except json.JSONDecodeError as e:
+            print(f"Erro ao decodificar JSON: {str(e)}")
+            print(f"Resposta recebida: {e.doc}")
+            return self._formatar_resposta_melhoria_padrao(tarefa)
         except Exception as e:
             print(f"Erro ao sugerir melhorias: {str(e)}")
             return self._formatar_resposta_melhoria_padrao(tarefa)
 
-    def analisar_mensagem(self, mensagem, tarefas_atuais=None):
-        """Analisa uma mensagem do utilizador e retorna uma resposta apropriada"""
-        try:
-            # Preparar o contexto com as tarefas atuais
-            contexto = ""
-            if tarefas_atuais:
-                contexto = "Tarefas atuais:\n"
-                for t in tarefas_atuais:
-                    contexto += f"- {t['titulo']} ({t['estado']}, {t['prioridade']})\n"
-            
-            # Preparar o prompt para a IA
-            prompt = f"""Contexto do Gestor de Tarefas:
+    def _agrupar_lotes(self, tarefas):
+        """Divide as tarefas em lotes que cabem no orçamento de tokens de um pedido"""
+        lotes = []
+        lote = []
+        usados = 0
+        for tarefa in tarefas:
+            linha = json.dumps({
+                "id": tarefa['id'],
+                "titulo": tarefa['titulo'],
+                "descricao": (tarefa.get('descricao') or '')[:self.max_caracteres_descricao_lote]
+            }, ensure_ascii=False)
+            # Estimativa conservadora de ~4 caracteres por token
+            custo = len(linha) // 4 + 1
+            if lote and (len(lote) >= self.max_tarefas_lote or usados + custo > self.max_tokens_lote):
+                lotes.append(lote)
+                lote = []
+                usados = 0
+            lote.append((tarefa['id'], linha))
+            usados += custo
+        if lote:
+            lotes.append(lote)
+        return lotes
+
+    def _categorizar_lote(self, lote, cancelado=None):
+        """Pede a categoria e a prioridade das tarefas de um lote e retorna as sugestões válidas por id"""
+        if cancelado is not None and cancelado.is_set():
+            return {}
+        linhas = "\n".join(linha for _, linha in lote)
+        prompt = f"""
+        Você é um assistente de gestão de tarefas. Para cada tarefa abaixo (uma por linha, em JSON),
+        escolha a categoria e a prioridade mais adequadas.
+        Responda APENAS com um objeto JSON válido, sem texto adicional.
+
+        Tarefas:
+        {linhas}
+
+        Formato da resposta (mantenha exatamente esta estrutura, com uma entrada por tarefa):
+        {{
+            "resultados": [
+                {{"id": 1, "categoria": "Trabalho|Estudos|Pessoal", "prioridade": "Alta|Média|Baixa"}}
+            ]
+        }}
+        """
+        dados = self._pedir_json(
+            [
+                {
+                    "role": "system",
+                    "content": "Você é um assistente especializado em análise de tarefas. Responda APENAS com JSON válido, sem texto adicional."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.1,
+            max_tokens=self.tokens_resposta_tarefa * len(lote) + 50,
+            prazo=self.prazo_lote
+        )
+
+        # Só são aceites ids do lote e valores conhecidos; o resto da resposta é ignorado
+        ids = {task_id for task_id, _ in lote}
+        sugestoes = {}
+        resultados = dados.get('resultados') if isinstance(dados, dict) else None
+        for item in resultados if isinstance(resultados, list) else []:
+            if not isinstance(item, dict):
+                continue
+            try:
+                task_id = int(item.get('id'))
+            except (TypeError, ValueError):
+                continue
+            if task_id not in ids:
+                continue
+            sugestao = {}
+            if item.get('categoria') in CATEGORIAS_IA:
+                sugestao['categoria'] = item['categoria']
+            if item.get('prioridade') in PRIORIDADES_IA:
+                sugestao['prioridade'] = item['prioridade']
+            if sugestao:
+                sugestoes[task_id] = sugestao
+        return sugestoes
+
+    def categorizar_tarefas(self, tarefas, cancelado=None):
+        """Sugere categoria e prioridade para muitas tarefas, agrupando várias por pedido.
+
+        Os lotes são pedidos em paralelo, dentro dos limites do cliente. Retorna um par
+        (sugestões por id da tarefa, número de lotes que falharam); um threading.Event
+        em `cancelado` impede o envio dos lotes que ainda não começaram.
+        """
+        lotes = self._agrupar_lotes(tarefas)
+        sugestoes = {}
+        falhados = 0
+        with ThreadPoolExecutor(max_workers=self.cliente.max_pedidos, thread_name_prefix='ia-lote') as executor:
+            futures = [executor.submit(self._categorizar_lote, lote, cancelado) for lote in lotes]
+            for future in as_completed(futures):
+                try:
+                    sugestoes.update(future.result())
+                except Exception as e:
+                    print(f"Erro ao categorizar lote de tarefas: {str(e)}")
+                    falhados += 1
+        return sugestoes, falhados
+
+    def _preparar_mensagens_chat(self, mensagem, tarefas_atuais=None, resumo=None):
+        """Monta as mensagens enviadas à API para uma mensagem do chat"""
+        # Preparar o contexto com o resumo e as tarefas mais relevantes para a mensagem
+        contexto = self._formatar_resumo(resumo) + "\n"
+        if tarefas_atuais:
+            contexto += "Tarefas relacionadas:\n"
+            contexto += self._limitar_contexto(
+                [f"- {t['titulo']} ({t['estado']}, {t['prioridade']})" for t in tarefas_atuais]) + "\n"
+        
+        # Preparar o prompt para a IA
+        prompt = f"""Contexto do Gestor de Tarefas:
 {contexto}
 
 Mensagem do utilizador: {mensagem}
@@ -182,35 +621,37 @@ Por favor, analise a mensagem e forneça:
 
 Responda em português de Portugal e mantenha um tom profissional mas amigável.
 """
-            
+        return [{
+            "role": "system",
+            "content": "Você é um assistente especializado em gestão de tarefas, focado em ajudar utilizadores a organizar e otimizar suas atividades."
+        }, {
+            "role": "user",
+            "content": prompt
+        }]
+
+    @staticmethod
+    def extrair_acoes(resposta_ia):
+        """Extrai as ações sugeridas (linhas em lista) de uma resposta da IA"""
+        acoes_sugeridas = []
+        linhas = resposta_ia.split('\n')
+        for linha in linhas:
+            if linha.strip().startswith('-') or linha.strip().startswith('*'):
+                acoes_sugeridas.append(linha.strip()[2:].strip())
+        return acoes_sugeridas
+
+    def analisar_mensagem(self, mensagem, tarefas_atuais=None, resumo=None):
+        """Analisa uma mensagem do utilizador e retorna uma resposta apropriada"""
+        try:
             # Fazer a chamada à API
-            client = groq.Groq(api_key=os.getenv('GROQ_API_KEY'))
-            chat_completion = client.chat.completions.create(
-                messages=[{
-                    "role": "system",
-                    "content": "Você é um assistente especializado em gestão de tarefas, focado em ajudar utilizadores a organizar e otimizar suas atividades."
-                }, {
-                    "role": "user",
-                    "content": prompt
-                }],
-                model="mixtral-8x7b-32768",
+            resposta_ia = self.cliente.criar(
+                self._preparar_mensagens_chat(mensagem, tarefas_atuais, resumo),
                 temperature=0.1,
                 max_tokens=1000
             )
             
-            # Processar a resposta
-            resposta_ia = chat_completion.choices[0].message.content
-            
-            # Tentar extrair ações sugeridas da resposta
-            acoes_sugeridas = []
-            linhas = resposta_ia.split('\n')
-            for linha in linhas:
-                if linha.strip().startswith('-') or linha.strip().startswith('*'):
-                    acoes_sugeridas.append(linha.strip()[2:].strip())
-            
             return {
                 'resposta': resposta_ia,
-                'acoes_sugeridas': acoes_sugeridas
+                'acoes_sugeridas': self.extrair_acoes(resposta_ia)
             }
             
         except Exception as e:
@@ -218,4 +659,68 @@ Responda em português de Portugal e mantenha um tom profissional mas amigável.
             return {
                 'resposta': "Desculpe, ocorreu um erro ao processar sua mensagem. Por favor, tente novamente mais tarde.",
                 'acoes_sugeridas': []
-            } 
\ No newline at end of file
+            }
+
+    def analisar_mensagem_stream(self, mensagem, tarefas_atuais=None, resumo=None):
+        """Versão de analisar_mensagem que produz o texto da resposta à medida que chega"""
+        recebido = False
+        try:
+            for parte in self.cliente.transmitir(
+                    self._preparar_mensagens_chat(mensagem, tarefas_atuais, resumo),
+                    temperature=0.1,
+                    max_tokens=1000):
+                recebido = True
+                yield parte
+        except Exception as e:
+            print(f"Erro ao analisar mensagem: {str(e)}")
+            if not recebido:
+                yield "Desculpe, ocorreu um erro ao processar sua mensagem. Por favor, tente novamente mais tarde."
+
+
+class AITaskAnalyzerAsync:
+    """Executa os pedidos do AITaskAnalyzer numa pool de threads e devolve futures"""
+
+    def __init__(self, analisador, max_workers=None):
+        self.analisador = analisador
+        # Por omissão, tantas threads quantos os pedidos que o cliente deixa em curso
+        max_workers = max_workers or analisador.cliente.max_pedidos
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ia')
+
+    def submeter(self, funcao, *args, **kwargs):
+        """Executa uma função numa thread da pool e retorna o future"""
+        return self._executor.submit(funcao, *args, **kwargs)
+
+    @staticmethod
+    def _resolver(contexto):
+        """Obtém o contexto na thread de trabalho quando é passado como função"""
+        return contexto() if callable(contexto) else contexto
+
+    def analisar_tarefa(self, titulo, descricao, tarefas_existentes=None, resumo=None, tarefas_similares=None):
+        """Versão assíncrona de analisar_tarefa; o contexto pode ser passado como função"""
+        return self.submeter(lambda: self.analisador.analisar_tarefa(
+            titulo, descricao, self._resolver(tarefas_existentes), self._resolver(resumo),
+            self._resolver(tarefas_similares)))
+
+    def sugerir_melhorias(self, tarefa):
+        """Versão assíncrona de sugerir_melhorias"""
+        return self.submeter(self.analisador.sugerir_melhorias, tarefa)
+
+    def analisar_mensagem(self, mensagem, tarefas_atuais=None, resumo=None):
+        """Versão assíncrona de analisar_mensagem; o contexto pode ser passado como função"""
+        return self.submeter(lambda: self.analisador.analisar_mensagem(
+            mensagem, self._resolver(tarefas_atuais), self._resolver(resumo)))
+
+    def analisar_mensagem_stream(self, mensagem, ao_receber, tarefas_atuais=None, resumo=None):
+        """Transmite a resposta numa thread da pool, chamando ao_receber(parte); o future retorna o texto completo"""
+        def transmitir():
+            partes = []
+            for parte in self.analisador.analisar_mensagem_stream(
+                    mensagem, self._resolver(tarefas_atuais), self._resolver(resumo)):
+                partes.append(parte)
+                ao_receber(parte)
+            return ''.join(partes)
+        return self.submeter(transmitir)
+
+    def encerrar(self):
+        """Cancela os pedidos em espera e liberta a pool sem bloquear"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
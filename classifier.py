@@ -0,0 +1,153 @@
+import json
+import math
+import os
+import threading
+from collections import Counter
+from task_index import tokenizar
+
+# Abaixo desta confiança (probabilidade da classe escolhida) a sugestão local não chega
+LIMIAR_CONFIANCA = 0.8
+# Número mínimo de tarefas classificadas num campo para o modelo dar sugestões
+MIN_EXEMPLOS = 20
+
+class ModeloBayes:
+    """Naive Bayes multinomial para um campo da tarefa, com suavização de Laplace"""
+
+    def __init__(self, alfa=1.0):
+        self.alfa = alfa
+        self.documentos = Counter()      # classe -> número de tarefas
+        self.termos = {}                 # classe -> Counter dos termos
+        self.total_termos = Counter()    # classe -> soma das frequências dos termos
+        self.vocabulario = Counter()     # termo -> frequência em todas as classes
+
+    def aprender(self, termos, classe, sinal=1):
+        """Junta (sinal=1) ou retira (sinal=-1) uma tarefa com os termos dados à classe"""
+        self.documentos[classe] += sinal
+        contagens = self.termos.setdefault(classe, Counter())
+        for termo, frequencia in termos.items():
+            contagens[termo] += sinal * frequencia
+            self.vocabulario[termo] += sinal * frequencia
+            if contagens[termo] <= 0:
+                del contagens[termo]
+            if self.vocabulario[termo] <= 0:
+                del self.vocabulario[termo]
+        self.total_termos[classe] += sinal * sum(termos.values())
+        if self.documentos[classe] <= 0:
+            del self.documentos[classe]
+            del self.termos[classe]
+            del self.total_termos[classe]
+
+    def prever(self, termos):
+        """Retorna (classe mais provável, probabilidade), ou (None, 0.0) sem exemplos suficientes"""
+        total = sum(self.documentos.values())
+        # Sem vocabulário (todos os títulos só com palavras ignoradas) os termos não dizem nada
+        if total < MIN_EXEMPLOS or not self.vocabulario:
+            return None, 0.0
+        tamanho_vocabulario = len(self.vocabulario)
+        pontuacoes = {}
+        for classe, documentos in self.documentos.items():
+            contagens = self.termos[classe]
+            denominador = math.log(self.total_termos[classe] + self.alfa * tamanho_vocabulario)
+            pontuacao = math.log(documentos / total)
+            # Termos que nunca apareceram no treino não distinguem as classes
+            for termo, frequencia in termos.items():
+                if termo in self.vocabulario:
+                    pontuacao += frequencia * (math.log(contagens[termo] + self.alfa) - denominador)
+            pontuacoes[classe] = pontuacao
+
+        # Normalizar as pontuações (logaritmos) em probabilidades
+        maxima = max(pontuacoes.values())
+        soma = sum(math.exp(pontuacao - maxima) for pontuacao in pontuacoes.values())
+        classe = max(pontuacoes, key=pontuacoes.get)
+        return classe, 1 / soma
+
+class ClassificadorTarefas:
+    """Sugere a categoria e a prioridade de uma tarefa a partir do título e da descrição.
+
+    Guarda os termos e os valores de cada tarefa aprendida, para que uma tarefa alterada ou
+    eliminada possa ser retirada do modelo exatamente como entrou.
+    """
+
+    CAMPOS = ('categoria', 'prioridade')
+    VERSAO = 1
+
+    def __init__(self, peso_titulo=2):
+        self.peso_titulo = peso_titulo
+        self.modelos = {campo: ModeloBayes() for campo in self.CAMPOS}
+        # Revisão do registo de alterações até à qual o modelo está atualizado
+        self.revisao = None
+        self._tarefas = {}   # task_id -> (Counter dos termos, {campo: valor})
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._tarefas)
+
+    def _termos(self, titulo, descricao):
+        return Counter(tokenizar(titulo) * self.peso_titulo + tokenizar(descricao))
+
+    def adicionar(self, task_id, titulo, descricao, categoria, prioridade):
+        """Aprende uma tarefa, substituindo a versão anterior se já existir"""
+        rotulos = {campo: valor for campo, valor in zip(self.CAMPOS, (categoria, prioridade)) if valor}
+        termos = self._termos(titulo, descricao)
+        with self._lock:
+            self._remover(task_id)
+            if rotulos:
+                self._aprender(task_id, termos, rotulos)
+
+    def remover(self, task_id):
+        """Retira uma tarefa do modelo"""
+        with self._lock:
+            self._remover(task_id)
+
+    def _aprender(self, task_id, termos, rotulos):
+        self._tarefas[task_id] = (termos, rotulos)
+        for campo, valor in rotulos.items():
+            self.modelos[campo].aprender(termos, valor)
+
+    def _remover(self, task_id):
+        anterior = self._tarefas.pop(task_id, None)
+        if anterior is None:
+            return
+        termos, rotulos = anterior
+        for campo, valor in rotulos.items():
+            self.modelos[campo].aprender(termos, valor, sinal=-1)
+
+    def sugerir(self, titulo, descricao):
+        """Retorna {campo: (valor sugerido, confiança entre 0 e 1)}; o valor é None sem dados suficientes"""
+        termos = self._termos(titulo, descricao)
+        with self._lock:
+            return {campo: modelo.prever(termos) for campo, modelo in self.modelos.items()}
+
+    def guardar(self, caminho):
+        """Grava o modelo num ficheiro JSON, substituindo o anterior de forma atómica"""
+        with self._lock:
+            dados = {
+                'versao': self.VERSAO,
+                'peso_titulo': self.peso_titulo,
+                'revisao': self.revisao,
+                'tarefas': {str(task_id): [termos, rotulos]
+                            for task_id, (termos, rotulos) in self._tarefas.items()}
+            }
+        temporario = caminho + '.tmp'
+        with open(temporario, 'w', encoding='utf-8') as f:
+            json.dump(dados, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def carregar(cls, caminho):
+        """Lê um modelo gravado; retorna None se o ficheiro não existir ou não for compatível"""
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                dados = json.load(f)
+            if dados.get('versao') != cls.VERSAO:
+                return None
+            classificador = cls(peso_titulo=dados['peso_titulo'])
+            for task_id, (termos, rotulos) in dados['tarefas'].items():
+                classificador._aprender(int(task_id), Counter(termos), rotulos)
+            classificador.revisao = dados['revisao']
+            return classificador
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Erro ao carregar o classificador: {str(e)}")
+            return None
@@ -1,22 +1,43 @@
 import sqlite3
 from datetime import datetime
 import os
+import re
+import json
+import base64
+import hashlib
+import threading
+import heapq
+from task_record import Task, CAMPOS_TAREFA
+from similarity import calcular_assinatura, chaves_lsh, empacotar, desempacotar, semelhanca
 
-class Database:
-    def __init__(self):
-        # Garantir que a pasta data existe
-        if not os.path.exists('data'):
-            os.makedirs('data')
-            
-        # Usar caminho absoluto para a base de dados
-        db_path = os.path.abspath(os.path.join('data', 'tasks.db'))
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
-        self.create_tables()
+# Chaves de ordenação tipadas por coluna ({t} é o prefixo da tabela, se houver): a
+# prioridade e o estado ordenam pela sua posição, e as datas ISO sem data ficam no fim.
+# Nenhuma chave pode ser NULL, para a paginação por chave comparar (chave, id).
+# As migrações têm as expressões dos índices escritas por extenso: uma chave nova ou
+# alterada aqui precisa de uma nova migração com o índice correspondente
+CHAVES_ORDENACAO = {
+    'id': '{t}id',
+    'titulo': '{t}titulo COLLATE NOCASE',
+    'categoria': "IFNULL({t}categoria, '') COLLATE NOCASE",
+    'prioridade': "CASE {t}prioridade WHEN 'Alta' THEN 3 WHEN 'Média' THEN 2 WHEN 'Baixa' THEN 1 ELSE 0 END",
+    'estado': "CASE {t}estado WHEN 'pendente' THEN 1 WHEN 'em progresso' THEN 2 WHEN 'concluída' THEN 3 ELSE 0 END",
+    'data_vencimento': "IFNULL(NULLIF({t}data_vencimento, ''), '9999-12-31')",
+}
 
-    def create_tables(self):
-        """Cria as tabelas se não existirem"""
-        self.cursor.execute('''
+# Campos que podem ser alterados depois de a tarefa ser criada
+CAMPOS_ATUALIZAVEIS = ('titulo', 'descricao', 'categoria', 'prioridade',
+                       'estado', 'data_vencimento', 'data_conclusao')
+
+# Número de alterações mantidas no registo; quem estiver mais atrasado recarrega tudo
+LIMITE_REGISTO_ALTERACOES = 10000
+
+# Migrações do esquema, por ordem. A versão aplicada fica guardada em
+# PRAGMA user_version, pelo que bases de dados existentes são atualizadas
+# ao abrir. Novas alterações ao esquema devem ser acrescentadas no fim.
+MIGRACOES = [
+    # 1: tabela de tarefas
+    [
+        '''
             CREATE TABLE IF NOT EXISTS tasks (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 titulo TEXT NOT NULL,
@@ -30,8 +51,302 @@ class Database:
                 parent_id INTEGER,
                 FOREIGN KEY (parent_id) REFERENCES tasks(id) ON DELETE CASCADE
             )
-        ''')
-        self.conn.commit()
+        ''',
+    ],
+    # 2: índices secundários para subtarefas e filtros
+    [
+        'CREATE INDEX IF NOT EXISTS idx_tasks_parent ON tasks(parent_id, id)',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_estado ON tasks(estado, prioridade)',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_prioridade ON tasks(prioridade)',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_categoria ON tasks(categoria)',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_vencimento ON tasks(data_vencimento, estado)',
+    ],
+    # 3: pesquisa de texto (FTS5) sobre o título e a descrição, mantida por triggers;
+    # remove_diacritics 2 faz 'reuniao' encontrar 'reunião'
+    [
+        '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+                titulo, descricao,
+                content='tasks', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_ai AFTER INSERT ON tasks BEGIN
+                INSERT INTO tasks_fts (rowid, titulo, descricao)
+                VALUES (new.id, new.titulo, new.descricao);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_ad AFTER DELETE ON tasks BEGIN
+                INSERT INTO tasks_fts (tasks_fts, rowid, titulo, descricao)
+                VALUES ('delete', old.id, old.titulo, old.descricao);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS tasks_fts_au AFTER UPDATE OF titulo, descricao ON tasks BEGIN
+                INSERT INTO tasks_fts (tasks_fts, rowid, titulo, descricao)
+                VALUES ('delete', old.id, old.titulo, old.descricao);
+                INSERT INTO tasks_fts (rowid, titulo, descricao)
+                VALUES (new.id, new.titulo, new.descricao);
+            END
+        ''',
+        # Indexar as tarefas que já existiam
+        "INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')",
+    ],
+    # 4: índices (pai, chave, id) para ordenar cada nível da hierarquia sem ordenação temporária
+    [
+        'CREATE INDEX IF NOT EXISTS idx_tasks_ordem_titulo ON tasks(parent_id, titulo COLLATE NOCASE, id)',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_ordem_categoria ON tasks(parent_id, categoria COLLATE NOCASE, id)',
+        """CREATE INDEX IF NOT EXISTS idx_tasks_ordem_prioridade ON tasks(parent_id, CASE prioridade WHEN 'Alta' THEN 3 WHEN 'Média' THEN 2 WHEN 'Baixa' THEN 1 ELSE 0 END, id)""",
+        """CREATE INDEX IF NOT EXISTS idx_tasks_ordem_estado ON tasks(parent_id, CASE estado WHEN 'pendente' THEN 1 WHEN 'em progresso' THEN 2 WHEN 'concluída' THEN 3 ELSE 0 END, id)""",
+        """CREATE INDEX IF NOT EXISTS idx_tasks_ordem_data_vencimento ON tasks(parent_id, IFNULL(NULLIF(data_vencimento, ''), '9999-12-31'), id)""",
+    ],
+    # 5: contadores por estado, prioridade e categoria, mantidos por triggers
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS task_stats (
+                dimensao TEXT NOT NULL,
+                valor TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                PRIMARY KEY (dimensao, valor)
+            ) WITHOUT ROWID
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS task_stats_ai AFTER INSERT ON tasks BEGIN
+                INSERT INTO task_stats (dimensao, valor, total)
+                VALUES ('estado', IFNULL(new.estado, ''), 1),
+                       ('prioridade', IFNULL(new.prioridade, ''), 1),
+                       ('categoria', IFNULL(new.categoria, ''), 1)
+                ON CONFLICT (dimensao, valor) DO UPDATE SET total = total + 1;
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS task_stats_ad AFTER DELETE ON tasks BEGIN
+                UPDATE task_stats SET total = total - 1
+                WHERE (dimensao = 'estado' AND valor = IFNULL(old.estado, ''))
+                   OR (dimensao = 'prioridade' AND valor = IFNULL(old.prioridade, ''))
+                   OR (dimensao = 'categoria' AND valor = IFNULL(old.categoria, ''));
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS task_stats_au AFTER UPDATE OF estado, prioridade, categoria ON tasks BEGIN
+                UPDATE task_stats SET total = total - 1
+                WHERE (dimensao = 'estado' AND valor = IFNULL(old.estado, ''))
+                   OR (dimensao = 'prioridade' AND valor = IFNULL(old.prioridade, ''))
+                   OR (dimensao = 'categoria' AND valor = IFNULL(old.categoria, ''));
+                INSERT INTO task_stats (dimensao, valor, total)
+                VALUES ('estado', IFNULL(new.estado, ''), 1),
+                       ('prioridade', IFNULL(new.prioridade, ''), 1),
+                       ('categoria', IFNULL(new.categoria, ''), 1)
+                ON CONFLICT (dimensao, valor) DO UPDATE SET total = total + 1;
+            END
+        ''',
+        # Contar as tarefas que já existiam
+        '''
+            INSERT INTO task_stats (dimensao, valor, total)
+            SELECT 'estado', IFNULL(estado, ''), COUNT(*) FROM tasks GROUP BY 2
+            UNION ALL
+            SELECT 'prioridade', IFNULL(prioridade, ''), COUNT(*) FROM tasks GROUP BY 2
+            UNION ALL
+            SELECT 'categoria', IFNULL(categoria, ''), COUNT(*) FROM tasks GROUP BY 2
+        ''',
+    ],
+    # 6: registo de alterações com uma revisão crescente, para outras vistas e processos
+    # saberem que tarefas mudaram
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS task_changes (
+                revisao INTEGER PRIMARY KEY AUTOINCREMENT,
+                task_id INTEGER NOT NULL,
+                operacao TEXT NOT NULL
+            )
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS task_changes_ai AFTER INSERT ON tasks BEGIN
+                INSERT INTO task_changes (task_id, operacao) VALUES (new.id, 'insert');
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS task_changes_au AFTER UPDATE ON tasks BEGIN
+                INSERT INTO task_changes (task_id, operacao) VALUES (new.id, 'update');
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS task_changes_ad AFTER DELETE ON tasks BEGIN
+                INSERT INTO task_changes (task_id, operacao) VALUES (old.id, 'delete');
+            END
+        ''',
+        f'''
+            CREATE TRIGGER IF NOT EXISTS task_changes_limite AFTER INSERT ON task_changes BEGIN
+                DELETE FROM task_changes WHERE revisao <= new.revisao - {LIMITE_REGISTO_ALTERACOES};
+            END
+        ''',
+    ],
+    # 7: índices (chave, id) para paginar por chave a lista completa, fora da hierarquia;
+    # a chave da categoria deixou de poder ser NULL e o seu índice por nível é refeito
+    [
+        'DROP INDEX IF EXISTS idx_tasks_ordem_categoria',
+        """CREATE INDEX idx_tasks_ordem_categoria ON tasks(parent_id, IFNULL(categoria, '') COLLATE NOCASE, id)""",
+        'CREATE INDEX IF NOT EXISTS idx_tasks_pagina_titulo ON tasks(titulo COLLATE NOCASE, id)',
+        """CREATE INDEX IF NOT EXISTS idx_tasks_pagina_categoria ON tasks(IFNULL(categoria, '') COLLATE NOCASE, id)""",
+        """CREATE INDEX IF NOT EXISTS idx_tasks_pagina_prioridade ON tasks(CASE prioridade WHEN 'Alta' THEN 3 WHEN 'Média' THEN 2 WHEN 'Baixa' THEN 1 ELSE 0 END, id)""",
+        """CREATE INDEX IF NOT EXISTS idx_tasks_pagina_estado ON tasks(CASE estado WHEN 'pendente' THEN 1 WHEN 'em progresso' THEN 2 WHEN 'concluída' THEN 3 ELSE 0 END, id)""",
+        """CREATE INDEX IF NOT EXISTS idx_tasks_pagina_data_vencimento ON tasks(IFNULL(NULLIF(data_vencimento, ''), '9999-12-31'), id)""",
+    ],
+    # 8: índice de semelhança (MinHash/LSH) sobre o título e a descrição. As assinaturas são
+    # calculadas em Python; os triggers retiram as entradas de tarefas alteradas ou eliminadas
+    # e deixam pendentes as tarefas gravadas sem assinatura (por exemplo, por outros processos)
+    [
+        '''
+            CREATE TABLE IF NOT EXISTS task_minhash (
+                task_id INTEGER PRIMARY KEY,
+                assinatura BLOB NOT NULL
+            )
+        ''',
+        '''
+            CREATE TABLE IF NOT EXISTS task_lsh (
+                chave INTEGER NOT NULL,
+                task_id INTEGER NOT NULL,
+                PRIMARY KEY (chave, task_id)
+            ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_task_lsh_tarefa ON task_lsh(task_id)',
+        'CREATE TABLE IF NOT EXISTS task_minhash_pendentes (task_id INTEGER PRIMARY KEY)',
+        '''
+            CREATE TRIGGER IF NOT EXISTS task_minhash_ai AFTER INSERT ON tasks BEGIN
+                INSERT OR IGNORE INTO task_minhash_pendentes (task_id) VALUES (new.id);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS task_minhash_au AFTER UPDATE OF titulo, descricao ON tasks BEGIN
+                DELETE FROM task_lsh WHERE task_id = old.id;
+                DELETE FROM task_minhash WHERE task_id = old.id;
+                INSERT OR IGNORE INTO task_minhash_pendentes (task_id) VALUES (new.id);
+            END
+        ''',
+        '''
+            CREATE TRIGGER IF NOT EXISTS task_minhash_ad AFTER DELETE ON tasks BEGIN
+                DELETE FROM task_lsh WHERE task_id = old.id;
+                DELETE FROM task_minhash WHERE task_id = old.id;
+                DELETE FROM task_minhash_pendentes WHERE task_id = old.id;
+            END
+        ''',
+        # As tarefas que já existiam ficam pendentes até update_similarity_index
+        'INSERT OR IGNORE INTO task_minhash_pendentes (task_id) SELECT id FROM tasks',
+    ],
+    # 9: pesquisa de texto sem os índices de prefixo da migração 3, que quase duplicavam o
+    # custo de cada escrita sem tornar visivelmente mais rápidas as pesquisas por prefixo;
+    # os triggers da migração 3 continuam a manter a nova tabela
+    [
+        'DROP TABLE IF EXISTS tasks_fts',
+        '''
+            CREATE VIRTUAL TABLE tasks_fts USING fts5(
+                titulo, descricao,
+                content='tasks', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+        ''',
+        "INSERT INTO tasks_fts (tasks_fts) VALUES ('rebuild')",
+    ],
+]
+
+# Peso do título face à descrição na ordenação dos resultados da pesquisa
+PESO_TITULO_PESQUISA = 2.0
+
+# Colunas e operadores aceites nos filtros; o operador vai como sufixo da coluna
+# (por exemplo data_vencimento__lte), sem sufixo é uma igualdade
+COLUNAS_FILTRAVEIS = ('id', 'titulo', 'descricao', 'categoria', 'prioridade', 'estado',
+                      'data_criacao', 'data_vencimento', 'data_conclusao', 'parent_id')
+OPERADORES_FILTRO = {'': '=', 'ne': '!=', 'lt': '<', 'lte': '<=', 'gt': '>', 'gte': '>=', 'in': 'IN',
+                     'isnull': 'IS NULL'}
+
+class Database:
+    def __init__(self, cache_size_kb=20000, busy_timeout_ms=5000):
+        # Garantir que a pasta data existe
+        if not os.path.exists('data'):
+            os.makedirs('data')
+            
+        # Usar caminho absoluto para a base de dados
+        self.db_path = os.path.abspath(os.path.join('data', 'tasks.db'))
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        
+        # Uma conexão por thread: com WAL, as threads de leitura (exportações,
+        # backups, contexto da IA) não ficam bloqueadas pelas escritas da interface
+        self._local = threading.local()
+        self._conexoes = {}
+        self._lock = threading.Lock()
+        self.create_tables()
+
+    def _abrir_conexao(self):
+        """Abre uma nova conexão configurada para acesso concorrente"""
+        # check_same_thread=False apenas para permitir fechar todas as conexões
+        # em close(); cada conexão continua a ser usada só pela sua thread
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000,
+                               check_same_thread=False)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute(f'PRAGMA cache_size = {-int(self.cache_size_kb)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+
+    @property
+    def conn(self):
+        """Conexão da thread atual, aberta na primeira utilização"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._abrir_conexao()
+            thread_atual = threading.current_thread()
+            with self._lock:
+                # Fechar as conexões de threads que já terminaram
+                for thread in [t for t in self._conexoes if not t.is_alive()]:
+                    self._conexoes.pop(thread).close()
+                self._conexoes[thread_atual] = conn
+            self._local.conn = conn
+            self._local.cursor = conn.cursor()
+        return conn
+
+    @property
+    def cursor(self):
+        """Cursor da thread atual"""
+        if getattr(self._local, 'conn', None) is None:
+            self.conn  # Abre a conexão (e o cursor) desta thread
+        return self._local.cursor
+
+    def close(self):
+        """Fecha as conexões de todas as threads"""
+        with self._lock:
+            conexoes = list(self._conexoes.values())
+            self._conexoes.clear()
+        for conn in conexoes:
+            conn.close()
+        # Uma nova utilização volta a abrir a conexão da thread
+        self._local = threading.local()
+
+    def create_tables(self):
+        """Cria as tabelas e aplica as migrações de esquema em falta"""
+        if self.cursor.execute('PRAGMA user_version').fetchone()[0] >= len(MIGRACOES):
+            return
+        while True:
+            # Cada migração corre numa transação própria com a nova versão. A escrita fica
+            # bloqueada desde o início e a versão é relida dentro da transação, porque outra
+            # instância pode ter aplicado a mesma migração entretanto
+            try:
+                self.cursor.execute('BEGIN IMMEDIATE')
+                versao = self.cursor.execute('PRAGMA user_version').fetchone()[0]
+                if versao >= len(MIGRACOES):
+                    self.conn.commit()
+                    return
+                for comando in MIGRACOES[versao]:
+                    self.cursor.execute(comando)
+                self.cursor.execute(f'PRAGMA user_version = {versao + 1}')
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
 
     def add_task(self, titulo, descricao, categoria, prioridade, data_vencimento, parent_id=None):
         """Adiciona uma nova tarefa"""
@@ -42,23 +357,86 @@ class Database:
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (titulo, descricao, categoria, prioridade, 'pendente', 
               data_criacao, data_vencimento, parent_id))
+        task_id = self.cursor.lastrowid
+        self._sign_tasks([task_id], novas=True)
         self.conn.commit()
-        return self.cursor.lastrowid
+        return task_id
+
+    def add_tasks_bulk(self, tarefas, chunk_size=500):
+        """Adiciona várias tarefas numa única transação e retorna os novos ids"""
+        data_criacao = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        ids = []
+        lote = []
+        try:
+            self.cursor.execute('BEGIN IMMEDIATE')
+            for tarefa in tarefas:
+                lote.append((tarefa['titulo'], tarefa.get('descricao'), tarefa.get('categoria'),
+                             tarefa.get('prioridade'), 'pendente', data_criacao,
+                             tarefa.get('data_vencimento'), tarefa.get('parent_id')))
+                if len(lote) >= chunk_size:
+                    ids.extend(self._inserir_lote(lote))
+                    lote = []
+            if lote:
+                ids.extend(self._inserir_lote(lote))
+            # As assinaturas MinHash ficam pendentes (trigger) para update_similarity_index,
+            # fora desta transação
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return ids
+
+    def _inserir_lote(self, lote):
+        """Insere um lote de tarefas e retorna os ids atribuídos"""
+        self.cursor.executemany('''
+            INSERT INTO tasks (titulo, descricao, categoria, prioridade, estado, 
+                             data_criacao, data_vencimento, parent_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', lote)
+        # Com AUTOINCREMENT e a escrita bloqueada, os ids do lote são consecutivos
+        self.cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = 'tasks'")
+        ultimo_id = self.cursor.fetchone()[0]
+        return list(range(ultimo_id - len(lote) + 1, ultimo_id + 1))
+
+    @staticmethod
+    def _build_columns(columns=None, prefixo=''):
+        """Retorna a lista de colunas a ler; o id é sempre incluído"""
+        if columns is None:
+            return f"{prefixo}*"
+        invalidas = set(columns) - set(CAMPOS_TAREFA)
+        if invalidas:
+            raise ValueError(f"Colunas inválidas: {', '.join(sorted(invalidas))}")
+        colunas = ['id'] + [coluna for coluna in columns if coluna != 'id']
+        return ', '.join(f"{prefixo}{coluna}" for coluna in colunas)
+
+    @staticmethod
+    def _to_tasks(cursor, linhas):
+        """Converte as linhas de uma consulta em registos Task"""
+        colunas = [descricao[0] for descricao in cursor.description]
+        return [Task.da_linha(colunas, linha) for linha in linhas]
 
-    def get_all_tasks(self):
-        """Retorna todas as tarefas"""
-        self.cursor.execute('SELECT * FROM tasks')
-        return self.cursor.fetchall()
+    def get_all_tasks(self, columns=None):
+        """Retorna todas as tarefas, opcionalmente só com algumas colunas"""
+        self.cursor.execute(f'SELECT {self._build_columns(columns)} FROM tasks')
+        return self._to_tasks(self.cursor, self.cursor.fetchall())
+
+    def iter_tasks(self, chunk_size=500, columns=None):
+        """Percorre todas as tarefas em blocos, sem carregar a tabela inteira em memória"""
+        cursor = self.conn.cursor()
+        cursor.execute(f'SELECT {self._build_columns(columns)} FROM tasks')
+        while True:
+            linhas = cursor.fetchmany(chunk_size)
+            if not linhas:
+                break
+            yield from self._to_tasks(cursor, linhas)
 
     def update_task(self, task_id, **kwargs):
         """Atualiza uma tarefa existente"""
-        valid_fields = ['titulo', 'descricao', 'categoria', 'prioridade', 
-                       'estado', 'data_vencimento', 'data_conclusao']
         updates = []
         values = []
         
         for key, value in kwargs.items():
-            if key in valid_fields:
+            if key in CAMPOS_ATUALIZAVEIS:
                 updates.append(f"{key} = ?")
                 values.append(value)
         
@@ -68,38 +446,391 @@ class Database:
         values.append(task_id)
         query = f"UPDATE tasks SET {', '.join(updates)} WHERE id = ?"
         self.cursor.execute(query, values)
+        if 'titulo' in kwargs or 'descricao' in kwargs:
+            self._sign_tasks([task_id])
         self.conn.commit()
         return True
 
+    def update_tasks_bulk(self, updates):
+        """Atualiza várias tarefas numa única transação e retorna o número de tarefas alteradas.
+
+        updates é uma sequência de pares (task_id, {campo: valor}). As tarefas com título ou
+        descrição alterados ficam pendentes no índice de semelhança (update_similarity_index).
+        """
+        # Tarefas com os mesmos campos a alterar partilham a mesma instrução
+        grupos = {}
+        for task_id, campos in updates:
+            campos = {campo: valor for campo, valor in campos.items() if campo in CAMPOS_ATUALIZAVEIS}
+            if campos:
+                colunas = tuple(sorted(campos))
+                grupos.setdefault(colunas, []).append(
+                    tuple(campos[coluna] for coluna in colunas) + (task_id,))
+        if not grupos:
+            return 0
+
+        total = 0
+        try:
+            self.cursor.execute('BEGIN IMMEDIATE')
+            for colunas, linhas in grupos.items():
+                atribuicoes = ', '.join(f"{coluna} = ?" for coluna in colunas)
+                self.cursor.executemany(f"UPDATE tasks SET {atribuicoes} WHERE id = ?", linhas)
+                total += self.cursor.rowcount
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return total
+
     def delete_task(self, task_id):
         """Elimina uma tarefa"""
         self.cursor.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
         self.conn.commit()
         return self.cursor.rowcount > 0
 
-    def get_tasks_by_filter(self, **filters):
-        """Retorna tarefas com base em filtros"""
-        query = 'SELECT * FROM tasks WHERE 1=1'
-        values = []
+    def _compile_query(self, text=None, order_by=None, reverse=False, **filters):
+        """Compila a pesquisa e os filtros numa consulta parametrizada.
         
-        for key, value in filters.items():
-            if value is not None:
-                query += f" AND {key} = ?"
-                values.append(value)
+        Retorna (origem, condições, valores, chave de ordenação, valores da chave, descendente),
+        ou None se nenhuma tarefa puder corresponder (uma lista de valores vazia).
+        """
+        condicoes = []
+        valores = []
+        for chave, valor in filters.items():
+            if valor is None:
+                continue
+            coluna, _, operador = chave.partition('__')
+            if coluna not in COLUNAS_FILTRAVEIS or operador not in OPERADORES_FILTRO:
+                raise ValueError(f"Filtro inválido: {chave}")
+            
+            if operador == 'isnull':
+                condicoes.append(f"tasks.{coluna} IS {'' if valor else 'NOT '}NULL")
+                continue
+            if isinstance(valor, (list, tuple, set, frozenset)):
+                if operador not in ('', 'in'):
+                    raise ValueError(f"O filtro {chave} não aceita uma lista de valores")
+                valor = list(valor)
+                if not valor:
+                    return None
+                condicoes.append(f"tasks.{coluna} IN ({', '.join('?' * len(valor))})")
+                valores.extend(valor)
+            else:
+                condicoes.append(f"tasks.{coluna} {OPERADORES_FILTRO[operador] if operador != 'in' else '='} ?")
+                valores.append(valor)
         
-        self.cursor.execute(query, values)
-        return self.cursor.fetchall()
+        origem = 'tasks'
+        expressao = self._build_match_query(text)
+        if expressao:
+            origem = 'tasks_fts JOIN tasks ON tasks.id = tasks_fts.rowid'
+            condicoes.insert(0, 'tasks_fts MATCH ?')
+            valores.insert(0, expressao)
+        
+        if order_by is not None:
+            if order_by not in CHAVES_ORDENACAO:
+                raise ValueError(f"Coluna de ordenação inválida: {order_by}")
+            return origem, condicoes, valores, CHAVES_ORDENACAO[order_by].format(t='tasks.'), [], reverse
+        if expressao:
+            # Por relevância: quanto menor o bm25, mais relevante
+            return origem, condicoes, valores, 'bm25(tasks_fts, ?, 1.0)', [PESO_TITULO_PESQUISA], False
+        return origem, condicoes, valores, 'tasks.id', [], False
+
+    def get_tasks_by_filter(self, text=None, order_by=None, reverse=False, limit=None, columns=None, **filters):
+        """Retorna tarefas com base em filtros, compilados numa só consulta parametrizada.
+        
+        Cada filtro é coluna=valor ou coluna__operador=valor (ne, lt, lte, gt, gte, in, e
+        isnull com True ou False); uma lista como valor equivale a __in. Filtros a None são
+        ignorados. Com text, só entram as tarefas encontradas pela pesquisa de texto, por
+        relevância se não houver order_by. columns limita as colunas lidas (as restantes
+        ficam a None).
+        """
+        consulta = self._compile_query(text, order_by, reverse, **filters)
+        if consulta is None:
+            return []
+        origem, condicoes, valores, chave, valores_chave, descendente = consulta
+        direcao = 'DESC' if descendente else 'ASC'
+        
+        query = f"SELECT {self._build_columns(columns, prefixo='tasks.')} FROM {origem}"
+        if condicoes:
+            query += " WHERE " + " AND ".join(condicoes)
+        query += f" ORDER BY {chave} {direcao}, tasks.id {direcao} LIMIT ?"
+        
+        self.cursor.execute(query, valores + valores_chave + [-1 if limit is None else limit])
+        return self._to_tasks(self.cursor, self.cursor.fetchall())
+
+    def count_tasks(self, text=None, **filters):
+        """Conta as tarefas que correspondem aos filtros (ver get_tasks_by_filter)"""
+        consulta = self._compile_query(text, **filters)
+        if consulta is None:
+            return 0
+        origem, condicoes, valores = consulta[:3]
+        query = f"SELECT COUNT(*) FROM {origem}"
+        if condicoes:
+            query += " WHERE " + " AND ".join(condicoes)
+        self.cursor.execute(query, valores)
+        return self.cursor.fetchone()[0]
+
+    @staticmethod
+    def _query_signature(text, order_by, reverse, filters):
+        """Identifica uma consulta, para recusar tokens de continuação de outra consulta"""
+        conteudo = json.dumps([text, order_by, bool(reverse), filters],
+                              sort_keys=True, default=lambda valor: sorted(valor, key=str))
+        return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()[:16]
+
+    def get_tasks_page(self, page_size=200, token=None, text=None, order_by=None, reverse=False,
+                       columns=None, **filters):
+        """Retorna uma página de tarefas e o token de continuação para a seguinte (None no fim).
+        
+        A paginação é por chave (keyset) sobre (chave de ordenação, id): cada página continua
+        a seguir à última tarefa da anterior, sem OFFSET, pelo que o custo não cresce com o
+        número de páginas já lidas. Os argumentos são os de get_tasks_by_filter e têm de ser
+        os mesmos em todas as páginas.
+        """
+        consulta = self._compile_query(text, order_by, reverse, **filters)
+        if consulta is None:
+            return [], None
+        origem, condicoes, valores, chave, valores_chave, descendente = consulta
+        direcao = 'DESC' if descendente else 'ASC'
+        assinatura = self._query_signature(text, order_by, reverse, filters)
+        
+        if token is not None:
+            try:
+                dados = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+                assinatura_token, valor_chave, ultimo_id = dados['c'], dados['k'], dados['i']
+            except (ValueError, KeyError, TypeError) as e:
+                raise ValueError(f"Token de continuação inválido: {e}")
+            if assinatura_token != assinatura:
+                raise ValueError("O token de continuação pertence a outra consulta")
+            # Equivale a (chave, id) > (valor, último id), escrito de forma a que o SQLite
+            # comece a leitura do índice diretamente na posição da chave
+            operador = '<' if descendente else '>'
+            condicoes = condicoes + [f"{chave} {operador}= ? AND ({chave} {operador} ? OR tasks.id {operador} ?)"]
+            valores = valores + valores_chave + [valor_chave] + valores_chave + [valor_chave, ultimo_id]
+        
+        # A chave vai como última coluna, para o token; uma linha a mais indica se há seguinte
+        query = f"SELECT {self._build_columns(columns, prefixo='tasks.')}, {chave} FROM {origem}"
+        if condicoes:
+            query += " WHERE " + " AND ".join(condicoes)
+        query += f" ORDER BY {chave} {direcao}, tasks.id {direcao} LIMIT ?"
+        self.cursor.execute(query, valores_chave + valores + valores_chave + [page_size + 1])
+        linhas = self.cursor.fetchall()
+        
+        proximo = None
+        if len(linhas) > page_size:
+            linhas = linhas[:page_size]
+            ultima = linhas[-1]
+            proximo = base64.urlsafe_b64encode(json.dumps(
+                {'c': assinatura, 'k': ultima[-1], 'i': ultima[0]}).encode('utf-8')).decode('ascii')
+        return self._to_tasks(self.cursor, (linha[:-1] for linha in linhas)), proximo
+
+    def iter_tasks_paged(self, page_size=500, **kwargs):
+        """Percorre as tarefas página a página (ver get_tasks_page), sem manter uma leitura aberta"""
+        token = None
+        while True:
+            tarefas, token = self.get_tasks_page(page_size, token, **kwargs)
+            yield from tarefas
+            if token is None:
+                break
+
+    @staticmethod
+    def _build_match_query(text):
+        """Converte o texto pesquisado numa expressão FTS5: todos os termos, cada um como prefixo"""
+        # Cada termo vai entre aspas para que a sintaxe do FTS5 (AND, OR, -, *) não seja interpretada
+        termos = re.findall(r'\w+', text or '')
+        return ' '.join(f'"{termo}"*' for termo in termos)
+
+    def search_tasks(self, text, limit=None, columns=None, **filters):
+        """Pesquisa no título e na descrição, por relevância; ignora acentos e aceita prefixos.
+        Sem termos a pesquisar retorna uma lista vazia (e não todas as tarefas)"""
+        if not self._build_match_query(text):
+            return []
+        return self.get_tasks_by_filter(text=text, limit=limit, columns=columns, **filters)
+
+    def get_tasks_by_ids(self, ids, columns=None):
+        """Retorna as tarefas existentes com os ids indicados, num dicionário por id"""
+        # Os ids vão num único parâmetro JSON e são cruzados com tasks numa só consulta, sem
+        # escrever nada nem terminar a transação de quem chama
+        self.cursor.execute(f'''
+            SELECT {self._build_columns(columns)} FROM tasks
+            WHERE id IN (SELECT value FROM json_each(?))
+        ''', (json.dumps([int(task_id) for task_id in ids]),))
+        return {tarefa.id: tarefa for tarefa in self._to_tasks(self.cursor, self.cursor.fetchall())}
+
+    def _sign_tasks(self, ids, novas=False, chunk_size=500):
+        """Calcula as assinaturas MinHash e as chaves LSH das tarefas indicadas, na transação atual.
+
+        Com novas=True (tarefas acabadas de inserir) não há entradas antigas a retirar.
+        """
+        ids = list(ids)
+        for inicio in range(0, len(ids), chunk_size):
+            bloco = ids[inicio:inicio + chunk_size]
+            marcadores = ', '.join('?' * len(bloco))
+            self.cursor.execute(f'SELECT id, titulo, descricao FROM tasks WHERE id IN ({marcadores})', bloco)
+            linhas = self.cursor.fetchall()
+            removidas = [(task_id,) for task_id in bloco]
+            if not novas:
+                self.cursor.executemany('DELETE FROM task_lsh WHERE task_id = ?', removidas)
+                self.cursor.executemany('DELETE FROM task_minhash WHERE task_id = ?', removidas)
+            self.cursor.executemany('DELETE FROM task_minhash_pendentes WHERE task_id = ?', removidas)
+
+            assinaturas = []
+            chaves = []
+            for task_id, titulo, descricao in linhas:
+                assinatura = calcular_assinatura(titulo, descricao)
+                if assinatura is None:
+                    continue
+                assinaturas.append((task_id, empacotar(assinatura)))
+                chaves.extend((chave, task_id) for chave in chaves_lsh(assinatura))
+            self.cursor.executemany('INSERT INTO task_minhash (task_id, assinatura) VALUES (?, ?)', assinaturas)
+            self.cursor.executemany('INSERT OR IGNORE INTO task_lsh (chave, task_id) VALUES (?, ?)', chaves)
+
+    def update_similarity_index(self, chunk_size=500):
+        """Calcula as assinaturas das tarefas pendentes, uma transação por bloco, e retorna quantas foram"""
+        total = 0
+        while True:
+            self.cursor.execute('SELECT task_id FROM task_minhash_pendentes LIMIT ?', (chunk_size,))
+            ids = [linha[0] for linha in self.cursor.fetchall()]
+            if not ids:
+                return total
+            try:
+                self.cursor.execute('BEGIN IMMEDIATE')
+                self._sign_tasks(ids)
+                self.conn.commit()
+            except Exception:
+                self.conn.rollback()
+                raise
+            total += len(ids)
+
+    def find_similar_tasks(self, titulo, descricao=None, limit=5, min_similarity=0.5, exclude_id=None,
+                           columns=None, max_candidates=200):
+        """Retorna até limit pares (Task, semelhança estimada) das tarefas com o texto mais parecido.
+
+        As candidatas são as tarefas que partilham alguma banda LSH com o texto, das que
+        partilham mais para as que partilham menos; a semelhança é estimada pelas assinaturas.
+        """
+        assinatura = calcular_assinatura(titulo, descricao)
+        if assinatura is None:
+            return []
+        chaves = chaves_lsh(assinatura)
+        marcadores = ', '.join('?' * len(chaves))
+        self.cursor.execute(f'''
+            SELECT candidatas.task_id, task_minhash.assinatura FROM (
+                SELECT task_id, COUNT(*) AS bandas FROM task_lsh
+                WHERE chave IN ({marcadores})
+                GROUP BY task_id ORDER BY bandas DESC LIMIT ?
+            ) AS candidatas
+            JOIN task_minhash ON task_minhash.task_id = candidatas.task_id
+        ''', chaves + [max_candidates])
+
+        pontuacoes = []
+        for task_id, dados in self.cursor.fetchall():
+            if task_id == exclude_id:
+                continue
+            pontuacao = semelhanca(assinatura, desempacotar(dados))
+            if pontuacao >= min_similarity:
+                pontuacoes.append((task_id, pontuacao))
+        melhores = heapq.nlargest(limit, pontuacoes, key=lambda item: (item[1], -item[0]))
+        tarefas = self.get_tasks_by_ids([task_id for task_id, _ in melhores], columns)
+        return [(tarefas[task_id], pontuacao) for task_id, pontuacao in melhores if task_id in tarefas]
+
+    def get_task_summary(self):
+        """Retorna o total de tarefas e as contagens por estado, prioridade e categoria"""
+        # Lido dos contadores mantidos pelos triggers, sem percorrer as tarefas
+        self.cursor.execute('SELECT dimensao, valor, total FROM task_stats WHERE total > 0')
+        contagens = {'estado': {}, 'prioridade': {}, 'categoria': {}}
+        for dimensao, valor, total in self.cursor.fetchall():
+            contagens[dimensao][valor] = total
+        return {
+            'total': sum(contagens['estado'].values()),
+            'por_estado': contagens['estado'],
+            'por_prioridade': contagens['prioridade'],
+            'por_categoria': contagens['categoria']
+        }
+
+    def get_overdue_count(self, today=None):
+        """Conta as tarefas por concluir com data de vencimento anterior a hoje (YYYY-MM-DD)"""
+        if today is None:
+            today = datetime.now().strftime('%Y-%m-%d')
+        self.cursor.execute('''
+            SELECT COUNT(*) FROM tasks
+            WHERE data_vencimento > '' AND data_vencimento < ?
+              AND IFNULL(estado, '') <> 'concluída'
+        ''', (today,))
+        return self.cursor.fetchone()[0]
+
+    def get_completion_percentiles(self, percentiles=(0.5, 0.9)):
+        """Retorna, por percentil, o tempo em horas entre a criação e a conclusão das tarefas
+        concluídas (None se não houver nenhuma)"""
+        colunas = ', '.join('MIN(CASE WHEN n >= ? * total THEN horas END)' for _ in percentiles)
+        self.cursor.execute(f'''
+            WITH duracoes AS (
+                SELECT (julianday(data_conclusao) - julianday(data_criacao)) * 24 AS horas
+                FROM tasks
+                WHERE estado = 'concluída' AND data_conclusao IS NOT NULL AND data_criacao IS NOT NULL
+            ),
+            ordenadas AS (
+                SELECT horas, ROW_NUMBER() OVER (ORDER BY horas) AS n, COUNT(*) OVER () AS total
+                FROM duracoes
+                WHERE horas IS NOT NULL
+            )
+            SELECT {colunas} FROM ordenadas
+        ''', list(percentiles))
+        return dict(zip(percentiles, self.cursor.fetchone()))
+
+    def get_data_version(self):
+        """Retorna o PRAGMA data_version da conexão desta thread, que muda quando outra
+        conexão (ou outro processo) grava na base de dados"""
+        return self.cursor.execute('PRAGMA data_version').fetchone()[0]
+
+    def get_revision(self):
+        """Retorna a revisão mais recente do registo de alterações"""
+        self.cursor.execute('SELECT IFNULL(MAX(revisao), 0) FROM task_changes')
+        return self.cursor.fetchone()[0]
+
+    def get_changes_since(self, revision):
+        """Retorna (revisão atual, {task_id: última operação}) das alterações depois de revision,
+        ou (revisão atual, None) se o registo já não chegar tão atrás"""
+        self.cursor.execute('SELECT IFNULL(MIN(revisao), 0), IFNULL(MAX(revisao), 0) FROM task_changes')
+        primeira, atual = self.cursor.fetchone()
+        if revision < primeira - 1 or revision > atual:
+            return atual, None
+        self.cursor.execute(
+            'SELECT task_id, operacao FROM task_changes WHERE revisao > ? ORDER BY revisao',
+            (revision,))
+        return atual, dict(self.cursor.fetchall())
 
     def get_subtasks(self, parent_id):
         """Retorna todas as subtarefas de uma tarefa"""
         self.cursor.execute('SELECT * FROM tasks WHERE parent_id = ?', (parent_id,))
-        return self.cursor.fetchall()
+        return self._to_tasks(self.cursor, self.cursor.fetchall())
+
+    @staticmethod
+    def _build_order_by(order_by, reverse=False, prefixo=''):
+        """Retorna a cláusula ORDER BY pela chave tipada da coluna, desempatada pelo id"""
+        if order_by not in CHAVES_ORDENACAO:
+            raise ValueError(f"Coluna de ordenação inválida: {order_by}")
+        direcao = 'DESC' if reverse else 'ASC'
+        chave = CHAVES_ORDENACAO[order_by].format(t=prefixo)
+        if order_by == 'id':
+            return f"{chave} {direcao}"
+        return f"{chave} {direcao}, {prefixo}id {direcao}"
+
+    def get_subtask_order(self, parent_id=None, order_by=None, reverse=False):
+        """Retorna (id, tem_subtarefas) dos filhos diretos de uma tarefa, ou das tarefas principais
+        se parent_id for None, ordenados pela coluna indicada dentro deste nível"""
+        ordem = self._build_order_by(order_by or 'id', reverse)
+        self.cursor.execute(f'''
+            SELECT id, EXISTS(SELECT 1 FROM tasks AS filhos WHERE filhos.parent_id = tasks.id)
+            FROM tasks
+            WHERE parent_id IS ?
+            ORDER BY {ordem}
+        ''', (parent_id,))
+        return [(task_id, bool(tem_filhos)) for task_id, tem_filhos in self.cursor.fetchall()]
 
     def has_subtasks(self, task_id):
         """Verifica se uma tarefa tem subtarefas"""
-        self.cursor.execute('SELECT COUNT(*) FROM tasks WHERE parent_id = ?', (task_id,))
-        return self.cursor.fetchone()[0] > 0
+        self.cursor.execute('SELECT EXISTS(SELECT 1 FROM tasks WHERE parent_id = ?)', (task_id,))
+        return self.cursor.fetchone()[0] == 1
 
     def __del__(self):
         """Fecha a conexão com a base de dados"""
-        self.conn.close() 
\ No newline at end of file
+        if hasattr(self, '_conexoes'):
+            self.close() 
\ No newline at end of file
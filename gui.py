@@ -2,12 +2,31 @@ import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap.dialogs import DatePickerDialog, Messagebox
 from ttkbootstrap.widgets import DateEntry
-from datetime import datetime
+from datetime import datetime, timedelta
 from tasks import TaskManager
-from ai_helper import AITaskAnalyzer
+from task_record import CAMPOS_LISTA
+from ai_helper import AITaskAnalyzer, AITaskAnalyzerAsync
+from classifier import LIMIAR_CONFIANCA
 import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from tkinter import filedialog
 
+# Correspondência entre as colunas da lista e os campos da tarefa; o título fica na coluna
+# da árvore ('#0'), que mostra a indentação e o indicador de expansão das subtarefas
+COLUNAS_LISTA = ('ID', 'Título', 'Categoria', 'Prioridade', 'Estado', 'Vencimento')
+COLUNAS_TREEVIEW = {'Título': '#0'}
+CAMPOS_COLUNAS = {
+    'ID': 'id',
+    'Título': 'titulo',
+    'Categoria': 'categoria',
+    'Prioridade': 'prioridade',
+    'Estado': 'estado',
+    'Vencimento': 'data_vencimento'
+}
+
 class CalendarDialog(ttk.Toplevel):
     def __init__(self, parent):
         super().__init__(parent)
@@ -58,6 +77,532 @@ class CalendarDialog(ttk.Toplevel):
         self.selected_date = self.calendar.entry.get()
         self.destroy()
 
+class DespachanteTk:
+    """Entrega na thread do Tk os resultados de trabalho feito noutras threads"""
+    
+    def __init__(self, root, intervalo_ms=50):
+        self.root = root
+        self.intervalo_ms = intervalo_ms
+        self._fila = queue.Queue()
+        self._cancelados = set()
+        self._after_id = self.root.after(self.intervalo_ms, self._processar)
+    
+    def chamar(self, funcao, *args):
+        """Agenda uma função para correr na thread do Tk (pode ser chamado de qualquer thread)"""
+        self._fila.put((funcao, args))
+    
+    def quando_concluir(self, future, ao_concluir, ao_falhar=None):
+        """Chama ao_concluir(resultado) ou ao_falhar(erro) na thread do Tk quando o future terminar"""
+        future.add_done_callback(lambda f: self.chamar(self._entregar, f, ao_concluir, ao_falhar))
+        return future
+    
+    def cancelar(self, future):
+        """Cancela o future; se já estiver a correr, o resultado é descartado"""
+        future.cancel()
+        self._cancelados.add(future)
+    
+    def _entregar(self, future, ao_concluir, ao_falhar):
+        if future.cancelled() or future in self._cancelados:
+            self._cancelados.discard(future)
+            return
+        erro = future.exception()
+        if erro is None:
+            ao_concluir(future.result())
+        elif ao_falhar:
+            ao_falhar(erro)
+        else:
+            print(f"Erro em tarefa de segundo plano: {str(erro)}")
+    
+    def _processar(self):
+        """Esvazia a fila e volta a agendar-se"""
+        # Reagendar primeiro: um callback pode abrir um diálogo modal
+        # e a fila tem de continuar a ser processada enquanto ele está aberto
+        self._after_id = self.root.after(self.intervalo_ms, self._processar)
+        try:
+            while True:
+                funcao, args = self._fila.get_nowait()
+                try:
+                    funcao(*args)
+                except Exception as e:
+                    print(f"Erro ao entregar resultado: {str(e)}")
+        except queue.Empty:
+            pass
+    
+    def parar(self):
+        """Deixa de processar a fila"""
+        if self._after_id:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+class FonteArvoreTarefas:
+    """Fonte da lista virtual com as tarefas principais e as subtarefas dos nós expandidos.
+    
+    As subtarefas de um nó só são lidas quando este é expandido e ficam em cache até
+    serem invalidadas. Cada nível é lido pela sua própria consulta, que segue o índice
+    (pai, chave, id): uma única consulta recursiva sobre toda a parte visível da árvore
+    tem de ordenar todas as linhas e fica mais lenta, exceto com muitos nós expandidos.
+    """
+    
+    def __init__(self, task_manager, coluna=None, reverso=False, expandidas=None):
+        self.task_manager = task_manager
+        self.coluna = coluna
+        self.reverso = reverso
+        # Conjunto partilhado com a GUI para manter os nós abertos entre atualizações
+        self.expandidas = expandidas if expandidas is not None else set()
+        self._filhos = {}   # id do pai (None para as principais) -> [(id, tem_subtarefas)]
+        self._pais = {}     # id -> id do pai, para as tarefas já carregadas
+        self.ordem = []     # linhas visíveis: (id, nível, tem_subtarefas)
+        # Posições em ordem, numeradas só quando são pedidas; as das primeiras _posicoes_ate
+        # linhas estão certas, as restantes podem ter ficado desatualizadas
+        self._posicoes = {}
+        self._posicoes_ate = 0
+        self._reconstruir()
+    
+    def contar(self):
+        return len(self.ordem)
+    
+    def obter(self, inicio, fim):
+        return self._ler(self.ordem[inicio:fim])
+    
+    def ancestrais(self, indice):
+        """Retorna as linhas dos antecessores da linha indicada, da raiz para baixo"""
+        if not 0 <= indice < len(self.ordem):
+            return []
+        cadeia = []
+        pai = self._pais.get(self.ordem[indice][0])
+        while pai is not None:
+            cadeia.append(pai)
+            pai = self._pais.get(pai)
+        cadeia.reverse()
+        return self._ler([(task_id, nivel, True) for nivel, task_id in enumerate(cadeia)])
+    
+    def indice(self, task_id):
+        """Retorna a posição de uma tarefa nas linhas visíveis, ou None"""
+        indice = self._posicoes.get(task_id)
+        if indice is not None and indice < self._posicoes_ate and self.ordem[indice][0] == task_id:
+            return indice
+        # Continuar a numerar a partir da última posição certa até encontrar a tarefa
+        for indice in range(self._posicoes_ate, len(self.ordem)):
+            atual = self.ordem[indice][0]
+            self._posicoes[atual] = indice
+            self._posicoes_ate = indice + 1
+            if atual == task_id:
+                return indice
+        return None
+    
+    def pais_carregados(self, ids):
+        """Retorna os pais das tarefas indicadas que já foram lidas (None para as principais)"""
+        return {self._pais[task_id] for task_id in ids if task_id in self._pais}
+    
+    def esta_expandida(self, task_id):
+        return task_id in self.expandidas
+    
+    def expandir(self, task_id):
+        """Mostra as subtarefas de um nó, lendo-as da base de dados se não estiverem em cache"""
+        if task_id in self.expandidas:
+            return False
+        self.expandidas.add(task_id)
+        self._atualizar_subarvore(task_id)
+        return True
+    
+    def recolher(self, task_id):
+        """Esconde as subtarefas de um nó, mantendo-as em cache"""
+        if task_id not in self.expandidas:
+            return False
+        self.expandidas.discard(task_id)
+        self._atualizar_subarvore(task_id)
+        return True
+    
+    def invalidar(self, pais=None):
+        """Descarta a cache dos filhos dos nós indicados (None na lista são as principais), ou toda.
+        
+        Só quando mudam as principais é que a lista é toda recalculada; nos outros casos são
+        substituídas no lugar as linhas abaixo de cada nó.
+        """
+        if pais is None:
+            self._filhos.clear()
+            self._pais.clear()
+            self._reconstruir()
+            return
+        pais = set(pais)
+        for pai in pais:
+            self._filhos.pop(pai, None)
+        if None in pais:
+            self._reconstruir()
+            return
+        for pai in pais:
+            if pai in self._pais:
+                self._atualizar_tem_filhos(pai)
+                self._atualizar_subarvore(pai)
+    
+    def _atualizar_tem_filhos(self, task_id):
+        """Atualiza se o nó tem subtarefas na lista do pai e na linha visível"""
+        tem_filhos = self.task_manager.tem_subtarefas(task_id)
+        irmaos = self._filhos.get(self._pais[task_id])
+        if irmaos is not None:
+            try:
+                irmaos[irmaos.index((task_id, not tem_filhos))] = (task_id, tem_filhos)
+            except ValueError:
+                pass
+        indice = self.indice(task_id)
+        if indice is not None:
+            _, nivel, _ = self.ordem[indice]
+            self.ordem[indice] = (task_id, nivel, tem_filhos)
+    
+    def _obter_filhos(self, task_id):
+        if task_id not in self._filhos:
+            filhos = self.task_manager.obter_ordem_subtarefas(task_id, self.coluna, self.reverso)
+            self._filhos[task_id] = filhos
+            for filho, _ in filhos:
+                self._pais[filho] = task_id
+        return self._filhos[task_id]
+    
+    def _reconstruir(self):
+        """Recalcula as linhas visíveis a partir das principais e dos nós expandidos"""
+        self.ordem = self._linhas_abaixo(None, -1)
+        self._posicoes = {}
+        self._posicoes_ate = 0
+    
+    def _linhas_abaixo(self, task_id, nivel):
+        """Linhas visíveis dos descendentes de um nó (None para as principais), sem o próprio nó"""
+        linhas = []
+        pilha = [(filho, nivel + 1, tem_netos) for filho, tem_netos in reversed(self._obter_filhos(task_id))]
+        while pilha:
+            task_id, nivel, tem_filhos = pilha.pop()
+            linhas.append((task_id, nivel, tem_filhos))
+            if tem_filhos and task_id in self.expandidas:
+                pilha.extend((filho, nivel + 1, tem_netos)
+                             for filho, tem_netos in reversed(self._obter_filhos(task_id)))
+        return linhas
+    
+    def _atualizar_subarvore(self, task_id):
+        """Substitui as linhas abaixo de um nó visível, sem recalcular o resto da lista"""
+        indice = self.indice(task_id)
+        if indice is None:
+            # Nó escondido dentro de outro recolhido: as linhas aparecem quando este for expandido
+            return
+        _, nivel, tem_filhos = self.ordem[indice]
+        fim = indice + 1
+        while fim < len(self.ordem) and self.ordem[fim][1] > nivel:
+            fim += 1
+        novas = self._linhas_abaixo(task_id, nivel) if tem_filhos and task_id in self.expandidas else []
+        self.ordem[indice + 1:fim] = novas
+        self._posicoes_ate = min(self._posicoes_ate, indice + 1)
+    
+    def _ler(self, linhas):
+        # A lista não mostra a descrição, que fica por ler
+        tarefas = self.task_manager.obter_tarefas_por_ids((task_id for task_id, _, _ in linhas), CAMPOS_LISTA)
+        return [(tarefas[task_id], nivel, tem_filhos)
+                for task_id, nivel, tem_filhos in linhas if task_id in tarefas]
+
+class FontePaginadaTarefas:
+    """Fonte da lista virtual com os resultados de uma pesquisa, lidos da base de dados por páginas.
+    
+    As páginas são pedidas por chave (token de continuação), pelo que só se alcançam pela
+    ordem; as que ficam pelo caminho são lidas só com o id.
+    """
+    
+    def __init__(self, task_manager, criterios, colunas=None, tamanho_pagina=200):
+        self.task_manager = task_manager
+        self.criterios = criterios
+        self.colunas = colunas
+        self.tamanho_pagina = tamanho_pagina
+        filtros = {chave: valor for chave, valor in criterios.items() if chave not in ('coluna', 'reverso')}
+        self.total = task_manager.contar_tarefas(**filtros)
+        self._tokens = [None]   # token de início de cada página já alcançada
+        self._fim = False
+        # A primeira página é lida já, normalmente fora da thread do Tk
+        self._primeira = self._ler_pagina(0)
+    
+    def contar(self):
+        return self.total
+    
+    def obter(self, inicio, fim):
+        linhas = []
+        pagina = inicio // self.tamanho_pagina
+        while pagina * self.tamanho_pagina < fim:
+            tarefas = self._ler_pagina(pagina)
+            base = pagina * self.tamanho_pagina
+            linhas.extend(tarefas[max(0, inicio - base):fim - base])
+            if len(tarefas) < self.tamanho_pagina:
+                break
+            pagina += 1
+        return [(tarefa, 0, False) for tarefa in linhas]
+    
+    def _ler_pagina(self, pagina):
+        if pagina == 0 and getattr(self, '_primeira', None) is not None:
+            tarefas, self._primeira = self._primeira, None
+            return tarefas
+        while len(self._tokens) <= pagina and not self._fim:
+            self._pedir(len(self._tokens) - 1, ('id',))
+        if pagina >= len(self._tokens):
+            return []
+        return self._pedir(pagina, self.colunas)
+    
+    def _pedir(self, pagina, colunas):
+        tarefas, token = self.task_manager.obter_pagina_tarefas(
+            self.tamanho_pagina, self._tokens[pagina], colunas=colunas, **self.criterios)
+        if token is None:
+            self._fim = True
+        elif pagina + 1 == len(self._tokens):
+            self._tokens.append(token)
+        return tarefas
+
+class VirtualTreeview:
+    """Treeview que só cria itens para as linhas visíveis, mais uma pequena margem"""
+    
+    def __init__(self, parent, formatar, overscan=5, tamanho_pagina=200, max_paginas=10, **kwargs):
+        # formatar(tarefa, nivel) -> (text, values, tags); a fonte tem contar() e obter(inicio, fim),
+        # que retorna (tarefa, nivel, tem_subtarefas), e pode expandir e recolher nós
+        self.formatar = formatar
+        self.overscan = overscan
+        self.tamanho_pagina = tamanho_pagina
+        self.max_paginas = max_paginas
+        
+        self.tree = ttk.Treeview(parent, **kwargs)
+        self.scrollbar = ttk.Scrollbar(parent, orient=VERTICAL, command=self._on_scrollbar)
+        
+        self.fonte = None
+        self.total = 0
+        self.inicio = 0
+        self.linhas_visiveis = 20
+        self._paginas = OrderedDict()
+        self._linhas = {}
+        self._ids_janela = []
+        # Antecessores da primeira linha fixos no topo da janela, que ocupam linhas visíveis
+        self._num_fixas = 0
+        self._selecao = set()
+        # Itens atualmente mostrados, por id de tarefa (que é também o iid do item), e os filhos de cada item
+        self._itens = {}
+        self._filhos_itens = {}
+        
+        self.tree.bind('<Configure>', self._on_configure)
+        self.tree.bind('<<TreeviewSelect>>', self._on_selecao)
+        self.tree.bind('<<TreeviewOpen>>', lambda e: self._alternar_no(True))
+        self.tree.bind('<<TreeviewClose>>', lambda e: self._alternar_no(False))
+        self.tree.bind('<MouseWheel>', lambda e: self._deslocar(-3 if e.delta > 0 else 3))
+        self.tree.bind('<Button-4>', lambda e: self._deslocar(-3))
+        self.tree.bind('<Button-5>', lambda e: self._deslocar(3))
+        self.tree.bind('<Up>', lambda e: self._mover_selecao(-1))
+        self.tree.bind('<Down>', lambda e: self._mover_selecao(1))
+        self.tree.bind('<Prior>', lambda e: self._mover_selecao(-self.linhas_visiveis))
+        self.tree.bind('<Next>', lambda e: self._mover_selecao(self.linhas_visiveis))
+        self.tree.bind('<Home>', lambda e: self._mover_selecao(-self.total))
+        self.tree.bind('<End>', lambda e: self._mover_selecao(self.total))
+    
+    def definir_fonte(self, fonte, manter_posicao=True):
+        """Mostra as linhas de uma nova fonte, mantendo ou não a posição do scroll"""
+        self.fonte = fonte
+        self.total = fonte.contar()
+        self._paginas.clear()
+        if not manter_posicao:
+            self.inicio = 0
+        self.inicio = self._limitar_inicio(self.inicio)
+        self._renderizar()
+    
+    def linha(self, iid):
+        """Retorna a tarefa de um item visível"""
+        return self._linhas.get(str(iid))
+    
+    def deslocar_para(self, inicio):
+        """Coloca a linha indicada no topo da janela visível"""
+        inicio = self._limitar_inicio(inicio)
+        if inicio != self.inicio:
+            self.inicio = inicio
+            self._renderizar()
+    
+    def _limitar_inicio(self, inicio):
+        """Limita o início da janela entre a primeira linha e o maior início com que a última
+        linha da lista ainda fica visível.
+        
+        Os antecessores da primeira linha ficam fixos no topo e ocupam linhas visíveis; são
+        tantos quantos o nível dessa linha, pelo que o limite depende do próprio início.
+        """
+        maximo = max(0, self.total - self.linhas_visiveis)
+        if hasattr(self.fonte, 'ancestrais'):
+            while maximo < self.total - 1:
+                linhas = self._obter_linhas(maximo, maximo + 1)
+                fixas = linhas[0][1] if linhas else 0
+                if maximo + max(1, self.linhas_visiveis - fixas) >= self.total:
+                    break
+                maximo += 1
+        return max(0, min(inicio, maximo))
+    
+    def _deslocar(self, linhas):
+        self.deslocar_para(self.inicio + linhas)
+        return "break"
+    
+    def _obter_linhas(self, inicio, fim):
+        """Lê as linhas [inicio, fim) a partir da cache de páginas"""
+        if fim <= inicio:
+            return []
+        primeira = inicio // self.tamanho_pagina
+        linhas = []
+        for pagina in range(primeira, (fim - 1) // self.tamanho_pagina + 1):
+            if pagina in self._paginas:
+                self._paginas.move_to_end(pagina)
+            else:
+                self._paginas[pagina] = self.fonte.obter(
+                    pagina * self.tamanho_pagina, (pagina + 1) * self.tamanho_pagina)
+                if len(self._paginas) > self.max_paginas:
+                    self._paginas.popitem(last=False)
+            linhas.extend(self._paginas[pagina])
+        deslocamento = inicio - primeira * self.tamanho_pagina
+        return linhas[deslocamento:deslocamento + fim - inicio]
+    
+    def _renderizar(self):
+        """Atualiza os itens da janela visível"""
+        fim = min(self.total, self.inicio + self.linhas_visiveis + self.overscan)
+        linhas = self._obter_linhas(self.inicio, fim) if self.fonte else []
+        # Os antecessores da primeira linha entram também, para a hierarquia da janela ficar completa
+        antecessores = self.fonte.ancestrais(self.inicio) if hasattr(self.fonte, 'ancestrais') else []
+        
+        desejados = []
+        self._linhas = {}
+        for tarefa, nivel, tem_filhos in antecessores + linhas:
+            text, values, tags = self.formatar(tarefa, nivel)
+            iid = str(tarefa.id)
+            pai = str(tarefa.parent_id) if nivel and str(tarefa.parent_id) in self._linhas else ''
+            aberto = tem_filhos and self.fonte.esta_expandida(tarefa.id)
+            desejados.append((iid, pai, text, tuple(values), tuple(tags), aberto))
+            if tem_filhos and not aberto:
+                # Filho provisório para a Treeview mostrar o indicador de expansão
+                desejados.append((f'{iid}-', iid, "A carregar...", (), ('provisorio',), False))
+            self._linhas[iid] = tarefa
+        self._reconciliar(desejados)
+        self._ids_janela = [str(tarefa.id) for tarefa, _, _ in linhas]
+        self._num_fixas = len(antecessores)
+        
+        # Repor a seleção das linhas que voltaram a estar visíveis
+        selecao = [iid for iid in self._selecao if iid in self._linhas]
+        if set(selecao) != set(self.tree.selection()):
+            self.tree.selection_set(selecao)
+        self._atualizar_scrollbar()
+    
+    def _reconciliar(self, desejados):
+        """Aplica à Treeview só as diferenças para a lista desejada de (iid, pai, text, values, tags, aberto),
+        em profundidade (cada pai antes dos filhos)"""
+        posicoes = {}
+        contagem = {}
+        for iid, pai, *_ in desejados:
+            posicoes[iid] = contagem.get(pai, 0)
+            contagem[pai] = posicoes[iid] + 1
+        
+        for iid, pai, text, values, tags, aberto in desejados:
+            indice = posicoes[iid]
+            irmaos = self._filhos_itens.setdefault(pai, [])
+            atual = self._itens.get(iid)
+            if atual is None:
+                self.tree.insert(pai, indice, iid=iid, text=text, values=values, tags=tags, open=aberto)
+                irmaos.insert(indice, iid)
+            else:
+                if atual[0] != pai or indice >= len(irmaos) or irmaos[indice] != iid:
+                    self.tree.move(iid, pai, indice)
+                    self._filhos_itens[atual[0]].remove(iid)
+                    irmaos.insert(indice, iid)
+                if atual[1:4] != (text, values, tags):
+                    self.tree.item(iid, text=text, values=values, tags=tags)
+                if atual[4] != aberto:
+                    self.tree.item(iid, open=aberto)
+            self._itens[iid] = (pai, text, values, tags, aberto)
+        
+        # Os itens que saíram da janela já não têm filhos desejados, que foram movidos acima;
+        # basta apagar os de topo, a Treeview apaga os descendentes
+        remover = {iid for iid in self._itens if iid not in posicoes}
+        if remover:
+            self.tree.delete(*[iid for iid in remover if self._itens[iid][0] not in remover])
+            for iid in remover:
+                pai = self._itens.pop(iid)[0]
+                if pai not in remover:
+                    self._filhos_itens[pai].remove(iid)
+                self._filhos_itens.pop(iid, None)
+    
+    def _alternar_no(self, expandir):
+        """Expande ou recolhe o nó aberto ou fechado pelo utilizador"""
+        iid = self.tree.focus()
+        if iid not in self._linhas or not hasattr(self.fonte, 'expandir'):
+            return
+        task_id = self._linhas[iid].id
+        if expandir:
+            alterado = self.fonte.expandir(task_id)
+        else:
+            alterado = self.fonte.recolher(task_id)
+            # Se o nó recolhido estava fixo acima da janela, a janela passa a começar nele
+            indice = self.fonte.indice(task_id)
+            if alterado and indice is not None and indice < self.inicio:
+                self.inicio = indice
+        if alterado:
+            self.total = self.fonte.contar()
+            self._paginas.clear()
+            self.inicio = self._limitar_inicio(self.inicio)
+            self._renderizar()
+    
+    def _atualizar_scrollbar(self):
+        if self.total <= 0:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.inicio / self.total,
+                               min(1, (self.inicio + self.linhas_visiveis) / self.total))
+    
+    def _on_scrollbar(self, *args):
+        if args[0] == 'moveto':
+            self.deslocar_para(int(float(args[1]) * self.total))
+        elif args[0] == 'scroll':
+            passo = self.linhas_visiveis if args[2] == 'pages' else 1
+            self.deslocar_para(self.inicio + int(args[1]) * passo)
+    
+    def _on_configure(self, event):
+        """Recalcula quantas linhas cabem na altura atual"""
+        try:
+            altura_linha = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        except (TypeError, ValueError):
+            altura_linha = 20
+        # Descontar a linha do cabeçalho
+        linhas = max(1, event.height // altura_linha - 1)
+        if linhas != self.linhas_visiveis:
+            self.linhas_visiveis = linhas
+            self.inicio = self._limitar_inicio(self.inicio)
+            self._renderizar()
+    
+    def _on_selecao(self, event):
+        # Manter a seleção de linhas fora da janela e atualizar a das visíveis
+        self._selecao = (self._selecao - set(self._linhas)) | {
+            iid for iid in self.tree.selection() if iid in self._linhas}
+    
+    def _mover_selecao(self, passo):
+        """Move a seleção pelo teclado, deslocando a janela quando necessário"""
+        if self.total == 0:
+            return "break"
+        foco = self.tree.focus()
+        atual = None
+        if foco in self._ids_janela:
+            atual = self.inicio + self._ids_janela.index(foco)
+        elif foco in self._linhas and hasattr(self.fonte, 'indice'):
+            # Antecessor fixo acima da janela: a posição vem da fonte
+            atual = self.fonte.indice(self._linhas[foco].id)
+        alvo = self.inicio if atual is None else atual + passo
+        alvo = max(0, min(self.total - 1, alvo))
+        
+        if alvo < self.inicio:
+            self.deslocar_para(alvo)
+        # As linhas fixas no topo mudam com o início da janela, por isso repetir até o alvo caber
+        while True:
+            livres = max(1, self.linhas_visiveis - self._num_fixas)
+            if alvo < self.inicio + livres:
+                break
+            inicio = self.inicio
+            self.deslocar_para(alvo - livres + 1)
+            if self.inicio == inicio:
+                break
+        
+        indice = alvo - self.inicio
+        if 0 <= indice < len(self._ids_janela):
+            iid = self._ids_janela[indice]
+            self._selecao = {iid}
+            self.tree.selection_set(iid)
+            self.tree.focus(iid)
+        return "break"
+
 class TaskManagerGUI:
     def __init__(self, root):
         self.root = root
@@ -82,8 +627,22 @@ class TaskManagerGUI:
 
         self.task_manager = TaskManager()
         
-        # Inicializar o analisador de IA
+        # Inicializar o analisador de IA; os pedidos correm fora da thread do Tk
+        # e os resultados regressam através do despachante
         self.ai_analyzer = AITaskAnalyzer()
+        self.ai_async = AITaskAnalyzerAsync(self.ai_analyzer)
+        self.despachante = DespachanteTk(self.root)
+        self._pedido_adicionar = None
+        # O classificador local e o índice de semelhança são preparados em segundo plano
+        # para as sugestões serem imediatas
+        self.ai_async.submeter(self.task_manager.preparar_classificador)
+        self.ai_async.submeter(self.task_manager.atualizar_indice_similaridade)
+        
+        # A pesquisa e os filtros correm numa thread própria, depois de uma pausa na escrita
+        self.executor_filtros = ThreadPoolExecutor(max_workers=1)
+        self.atraso_filtros_ms = 250
+        self._filtro_agendado = None
+        self._pedido_filtro = None
         
         # Variáveis
         self.var_titulo = ttk.StringVar()
@@ -102,7 +661,7 @@ class TaskManagerGUI:
         self.root.bind('<Control-n>', lambda e: self._adicionar_tarefa())  # Ctrl+N: Nova tarefa
         self.root.bind('<Control-d>', lambda e: self._eliminar_tarefa())   # Ctrl+D: Eliminar tarefa
         self.root.bind('<Control-f>', lambda e: self._focar_pesquisa())    # Ctrl+F: Focar pesquisa
-        self.root.bind('<F5>', lambda e: self._atualizar_lista_tarefas())  # F5: Atualizar lista
+        self.root.bind('<F5>', lambda e: self._sincronizar())              # F5: Atualizar lista
         
         # Criar menu superior
         self.menu_bar = ttk.Menu(self.root)
@@ -119,11 +678,31 @@ class TaskManagerGUI:
             self.tema_menu.add_command(label=tema.capitalize(), command=lambda t=tema: self._mudar_tema(t))
         
         self.opcoes_menu.add_command(label="Estatísticas", command=self._mostrar_estatisticas)
+        self.opcoes_menu.add_command(label="Categorizar tarefas com IA", command=self._categorizar_tarefas_ia)
+        
+        # Mostrar as respostas do chat à medida que chegam
+        self.var_chat_tempo_real = ttk.BooleanVar(value=True)
+        self.opcoes_menu.add_checkbutton(label="Respostas da IA em tempo real", variable=self.var_chat_tempo_real)
+        # Sem esta opção, as novas tarefas só vão à IA quando o classificador local tem dúvidas
+        self.var_sempre_ia = ttk.BooleanVar(value=False)
+        self.opcoes_menu.add_checkbutton(label="Analisar novas tarefas sempre com IA", variable=self.var_sempre_ia)
+        self._contador_respostas = 0
+        # Continuação do comando /listar_tarefas
+        self.tamanho_pagina_listagem = 50
+        self._token_listagem = None
         self.opcoes_menu.add_separator()
         self.opcoes_menu.add_command(label="Backup", command=self._fazer_backup)
         
+        # Acompanhar as alterações feitas por outras instâncias ou scripts: a base de dados
+        # é consultada periodicamente e só as tarefas alteradas desde a última revisão são lidas
+        self.revisao = self.task_manager.revisao_atual()
+        self._versao_dados = self.task_manager.versao_dados()
+        self.intervalo_verificacao_ms = 1000
+        self._verificacao_agendada = None
+        
         self._criar_widgets()
         self._atualizar_lista_tarefas()
+        self._verificacao_agendada = self.root.after(self.intervalo_verificacao_ms, self._verificar_alteracoes)
 
     def _get_center_position(self):
         """Calcula a posição central da tela"""
@@ -164,22 +743,15 @@ class TaskManagerGUI:
             self.ordem_atual['coluna'] = coluna
             self.ordem_atual['reverso'] = False
         
-        # Obter todos os itens da Treeview
-        items = [(self.tree.set(item, coluna), item) for item in self.tree.get_children('')]
-        
-        # Ordenar itens
-        items.sort(reverse=self.ordem_atual['reverso'])
-        
-        # Reordenar a Treeview
-        for index, (val, item) in enumerate(items):
-            self.tree.move(item, '', index)
+        # A ordenação é aplicada pela fonte de dados, não aos itens visíveis
+        self._atualizar_lista_tarefas()
         
         # Atualizar cabeçalhos para mostrar a ordem
-        for col in self.tree['columns']:
+        for col in COLUNAS_LISTA:
             if col == coluna:
-                self.tree.heading(col, text=f"{col} {'↓' if self.ordem_atual['reverso'] else '↑'}")
+                self.tree.heading(COLUNAS_TREEVIEW.get(col, col), text=f"{col} {'↓' if self.ordem_atual['reverso'] else '↑'}")
             else:
-                self.tree.heading(col, text=col)
+                self.tree.heading(COLUNAS_TREEVIEW.get(col, col), text=col)
 
     def _criar_widgets(self):
         # Frame principal com padding
@@ -306,7 +878,7 @@ class TaskManagerGUI:
         ).pack(side=LEFT, padx=5)
         
         self.var_pesquisa = ttk.StringVar()
-        self.var_pesquisa.trace('w', lambda *args: self._filtrar_tarefas())
+        self.var_pesquisa.trace('w', lambda *args: self._agendar_filtro())
         ttk.Entry(
             search_frame,
             textvariable=self.var_pesquisa,
@@ -330,7 +902,7 @@ class TaskManagerGUI:
             width=15,
             bootstyle="primary"
         ).pack(side=LEFT, padx=5)
-        self.var_filtro_estado.trace('w', lambda *args: self._filtrar_tarefas())
+        self.var_filtro_estado.trace('w', lambda *args: self._agendar_filtro())
         
         # Filtro de Prioridade
         self.var_filtro_prioridade = ttk.StringVar(value="Todas")
@@ -341,37 +913,35 @@ class TaskManagerGUI:
             width=15,
             bootstyle="primary"
         ).pack(side=LEFT, padx=5)
-        self.var_filtro_prioridade.trace('w', lambda *args: self._filtrar_tarefas())
+        self.var_filtro_prioridade.trace('w', lambda *args: self._agendar_filtro())
         
-        # Treeview com estilo moderno
-        self.tree = ttk.Treeview(
+        # Lista virtual: a Treeview só tem itens para as linhas visíveis
+        self.lista = VirtualTreeview(
             list_frame,
-            columns=('ID', 'Título', 'Categoria', 'Prioridade', 'Estado', 'Vencimento'),
-            show='headings',
+            self._formatar_tarefa,
+            columns=tuple(col for col in COLUNAS_LISTA if col not in COLUNAS_TREEVIEW),
+            show='tree headings',
             bootstyle="primary"
         )
+        self.tree = self.lista.tree
         
         # Configurar colunas
         self.tree.heading('ID', text='ID')
-        self.tree.heading('Título', text='Título')
+        self.tree.heading('#0', text='Título')
         self.tree.heading('Categoria', text='Categoria')
         self.tree.heading('Prioridade', text='Prioridade')
         self.tree.heading('Estado', text='Estado')
         self.tree.heading('Vencimento', text='Vencimento')
         
         self.tree.column('ID', width=50)
-        self.tree.column('Título', width=200)
+        self.tree.column('#0', width=250)
         self.tree.column('Categoria', width=100)
         self.tree.column('Prioridade', width=100)
         self.tree.column('Estado', width=100)
         self.tree.column('Vencimento', width=120)
         
-        # Scrollbar para a Treeview
-        scrollbar = ttk.Scrollbar(list_frame, orient=VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
-        
         self.tree.pack(side=LEFT, fill=BOTH, expand=YES)
-        scrollbar.pack(side=RIGHT, fill=Y)
+        self.lista.scrollbar.pack(side=RIGHT, fill=Y)
         
         # Container direito (chat)
         chat_container = ttk.Frame(content_frame)
@@ -541,8 +1111,8 @@ class TaskManagerGUI:
         ).pack(side=LEFT, padx=export_btn_padx)
 
         # Configurar cabeçalhos clicáveis para ordenação
-        for col in ('ID', 'Título', 'Categoria', 'Prioridade', 'Estado', 'Vencimento'):
-            self.tree.heading(col, text=col, command=lambda c=col: self._ordenar_coluna(c))
+        for col in COLUNAS_LISTA:
+            self.tree.heading(COLUNAS_TREEVIEW.get(col, col), text=col, command=lambda c=col: self._ordenar_coluna(c))
 
     def _adicionar_tarefa(self):
         titulo = self.var_titulo.get()
@@ -554,18 +1124,96 @@ class TaskManagerGUI:
                 position=self._get_center_position()
             )
             return
+        if self._pedido_adicionar is not None:
+            # Já há uma análise em curso para uma nova tarefa
+            return
         
-        try:
-            # Analisar a tarefa com IA antes de adicionar
-            analise = self.ai_analyzer.analisar_tarefa(
-                titulo=titulo,
-                descricao=self.var_descricao.get(),
-                tarefas_existentes=[{
-                    'titulo': t[1],
-                    'descricao': t[2]
-                } for t in self.task_manager.obter_todas_tarefas()]
+        descricao = self.var_descricao.get()
+        
+        # Sugestão imediata do classificador local; a IA só é consultada se ele tiver dúvidas
+        if not self.var_sempre_ia.get():
+            analise = self._analise_local(titulo, descricao)
+            if analise is not None:
+                self._concluir_adicionar_tarefa(titulo, descricao, analise)
+                return
+        
+        # Analisar a tarefa com IA antes de adicionar, sem bloquear a interface
+        future = self.ai_async.analisar_tarefa(
+            titulo=titulo,
+            descricao=descricao,
+            tarefas_existentes=lambda: [t.para_dict(('titulo', 'descricao')) for t in self.task_manager.obter_tarefas_relevantes(
+                f"{titulo} {descricao}", self.ai_analyzer.max_tarefas_contexto)],
+            resumo=self.task_manager.resumo_tarefas,
+            tarefas_similares=lambda: self._tarefas_similares(titulo, descricao)
+        )
+        self._pedido_adicionar = future
+        dialog = self._mostrar_progresso_ia("A analisar a tarefa com IA...", future,
+                                            ao_cancelar=self._cancelar_adicionar_tarefa)
+        
+        def ao_concluir(analise):
+            self._pedido_adicionar = None
+            dialog.destroy()
+            self._concluir_adicionar_tarefa(titulo, descricao, analise)
+        
+        def ao_falhar(erro):
+            self._pedido_adicionar = None
+            dialog.destroy()
+            Messagebox.show_error(
+                title="Erro",
+                message=f"Erro ao adicionar tarefa: {str(erro)}",
+                parent=self.root,
+                position=self._get_center_position()
             )
-            
+        
+        self.despachante.quando_concluir(future, ao_concluir, ao_falhar)
+    
+    def _analise_local(self, titulo, descricao):
+        """Sugestões do classificador local no formato da análise da IA, ou None se tiver dúvidas"""
+        try:
+            sugestoes = self.task_manager.sugerir_classificacao(titulo, descricao, esperar=False)
+        except Exception as e:
+            print(f"Erro no classificador local: {str(e)}")
+            return None
+        if sugestoes is None:
+            return None
+        categoria, confianca_categoria = sugestoes['categoria']
+        prioridade, confianca_prioridade = sugestoes['prioridade']
+        if categoria is None or prioridade is None:
+            return None
+        if min(confianca_categoria, confianca_prioridade) < LIMIAR_CONFIANCA:
+            return None
+        
+        # O classificador não sugere datas: mantém-se a data escolhida ou uma semana a partir de hoje
+        data_vencimento = self.var_data_vencimento.get() or (
+            datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
+        return {
+            "prioridade": prioridade,
+            "categoria": categoria,
+            "data_vencimento": data_vencimento,
+            "tarefas_similares": self._tarefas_similares(titulo, descricao),
+            "justificativas": {
+                "prioridade": f"Sugerida pelo classificador local ({confianca_prioridade:.0%} de confiança)",
+                "categoria": f"Sugerida pelo classificador local ({confianca_categoria:.0%} de confiança)",
+                "data_vencimento": "Data atual do formulário ou uma semana a partir de hoje"
+            }
+        }
+    
+    def _tarefas_similares(self, titulo, descricao):
+        """Títulos das tarefas quase iguais à nova tarefa, com a semelhança estimada"""
+        try:
+            return [f"{tarefa.titulo} ({pontuacao:.0%})"
+                    for tarefa, pontuacao in self.task_manager.obter_tarefas_similares(titulo, descricao)]
+        except Exception as e:
+            print(f"Erro ao procurar tarefas similares: {str(e)}")
+            return []
+    
+    def _cancelar_adicionar_tarefa(self):
+        """Esquece a análise pendente; os campos do formulário mantêm-se"""
+        self._pedido_adicionar = None
+    
+    def _concluir_adicionar_tarefa(self, titulo, descricao, analise):
+        """Mostra as sugestões da IA e cria a tarefa"""
+        try:
             if analise:
                 # Mostrar sugestões ao utilizador
                 resposta = self._mostrar_sugestoes_ia(analise)
@@ -578,14 +1226,14 @@ class TaskManagerGUI:
             # Criar a tarefa
             self.task_manager.criar_tarefa(
                 titulo=titulo,
-                descricao=self.var_descricao.get(),
+                descricao=descricao,
                 categoria=self.var_categoria.get(),
                 prioridade=self.var_prioridade.get(),
                 data_vencimento=self.var_data_vencimento.get()
             )
             
             self._limpar_campos()
-            self._atualizar_lista_tarefas()
+            self._atualizar_lista_tarefas(pais_alterados=[None])
             Messagebox.show_info(
                 title="Sucesso",
                 message="Tarefa adicionada com sucesso!",
@@ -600,6 +1248,36 @@ class TaskManagerGUI:
                 position=self._get_center_position()
             )
 
+    def _mostrar_progresso_ia(self, mensagem, future, ao_cancelar=None):
+        """Mostra uma janela de espera; fechá-la cancela o pedido à IA"""
+        dialog = ttk.Toplevel(self.root)
+        dialog.title("Assistente IA")
+        
+        # Centralizar a janela
+        window_width = 320
+        window_height = 140
+        screen_width = self.root.winfo_screenwidth()
+        screen_height = self.root.winfo_screenheight()
+        center_x = int(screen_width/2 - window_width/2)
+        center_y = int(screen_height/2 - window_height/2)
+        dialog.geometry(f'{window_width}x{window_height}+{center_x}+{center_y}')
+        
+        ttk.Label(dialog, text=mensagem).pack(padx=20, pady=(20, 10))
+        barra = ttk.Progressbar(dialog, mode='indeterminate', bootstyle="info-striped")
+        barra.pack(fill=X, padx=20)
+        barra.start()
+        
+        def cancelar():
+            self.despachante.cancelar(future)
+            dialog.destroy()
+            if ao_cancelar:
+                ao_cancelar()
+        
+        ttk.Button(dialog, text="Cancelar", command=cancelar, bootstyle="secondary").pack(pady=10)
+        dialog.protocol("WM_DELETE_WINDOW", cancelar)
+        dialog.transient(self.root)
+        return dialog
+
     def _mostrar_sugestoes_ia(self, analise):
         """Mostra uma janela com as sugestões da IA"""
         # Criar janela de diálogo
@@ -666,44 +1344,84 @@ Razão: {analise['justificativas']['data_vencimento']}
         self.var_prioridade.set("")
         self.var_data_vencimento.set("")
 
-    def _atualizar_lista_tarefas(self):
-        """Atualiza a lista de tarefas com indentação para subtarefas"""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # Primeiro adicionar tarefas principais
-        tarefas_principais = self.task_manager.obter_todas_tarefas(incluir_subtarefas=False)
-        for tarefa in tarefas_principais:
-            item = self._inserir_tarefa(tarefa)
-            # Adicionar subtarefas
-            self._adicionar_subtarefas_recursivamente(tarefa[0], item)
+    def _atualizar_lista_tarefas(self, pais_alterados=None):
+        """Atualiza a lista de tarefas; pais_alterados são os ids cujas subtarefas mudaram
+        (None para as tarefas principais), e sem eles é relida toda a hierarquia"""
+        # Sem ordenação escolhida, a hierarquia segue a ordem de criação
+        coluna, reverso = None, False
+        if self.ordem_atual['coluna'] != 'ID' or self.ordem_atual['reverso']:
+            coluna = CAMPOS_COLUNAS[self.ordem_atual['coluna']]
+            reverso = self.ordem_atual['reverso']
+        
+        fonte = getattr(self, 'fonte_arvore', None)
+        if fonte is None or (fonte.coluna, fonte.reverso) != (coluna, reverso):
+            # Os nós abertos mantêm-se quando muda a ordenação
+            expandidas = fonte.expandidas if fonte is not None else set()
+            self.fonte_arvore = FonteArvoreTarefas(self.task_manager, coluna, reverso, expandidas)
+        else:
+            self.fonte_arvore.invalidar(pais_alterados)
+        
+        if self._filtros_ativos():
+            self._filtrar_tarefas()
+            return
+        self.lista.definir_fonte(self.fonte_arvore)
     
-    def _adicionar_subtarefas_recursivamente(self, parent_id, parent_item):
-        """Adiciona subtarefas recursivamente"""
-        subtarefas = self.task_manager.obter_subtarefas(parent_id)
-        for subtarefa in subtarefas:
-            item = self._inserir_tarefa(subtarefa, parent_item)
-            # Recursivamente adicionar sub-subtarefas
-            self._adicionar_subtarefas_recursivamente(subtarefa[0], item)
+    def _verificar_alteracoes(self):
+        """Sincroniza a lista quando outra conexão gravou na base de dados"""
+        self._verificacao_agendada = self.root.after(self.intervalo_verificacao_ms, self._verificar_alteracoes)
+        try:
+            versao = self.task_manager.versao_dados()
+            if versao != self._versao_dados:
+                self._versao_dados = versao
+                self._sincronizar()
+        except Exception as e:
+            print(f"Erro ao verificar alterações: {str(e)}")
+
+    def _sincronizar(self):
+        """Lê só as tarefas alteradas desde a última revisão e atualiza as partes afetadas da lista"""
+        revisao, alteradas, eliminadas = self.task_manager.obter_alteracoes(self.revisao)
+        if revisao == self.revisao and alteradas is not None:
+            return
+        # Tarefas gravadas por outros processos ficam pendentes no índice de semelhança, e o
+        # classificador local aprende as alterações fora da thread da interface
+        self.ai_async.submeter(self.task_manager.atualizar_indice_similaridade)
+        self.ai_async.submeter(self.task_manager.preparar_classificador)
+        if alteradas is None:
+            self.revisao = revisao
+            self._atualizar_lista_tarefas()
+            return
+        self.revisao = revisao
+        
+        # Invalidar a cache dos pais atuais e anteriores das tarefas alteradas
+        ids = set(alteradas) | eliminadas
+        pais = {tarefa.parent_id for tarefa in alteradas.values()}
+        if getattr(self, 'fonte_arvore', None) is not None:
+            pais |= self.fonte_arvore.pais_carregados(ids)
+        self._atualizar_lista_tarefas(pais_alterados=pais)
+
+    def _pai_da_tarefa(self, task_id):
+        """Retorna o id do pai de uma tarefa visível (None se for uma tarefa principal)"""
+        tarefa = self.lista.linha(task_id)
+        return tarefa.parent_id if tarefa else None
     
-    def _inserir_tarefa(self, tarefa, parent=''):
-        """Insere uma tarefa na Treeview"""
+    def _formatar_tarefa(self, tarefa, nivel=0):
+        """Retorna o título, os valores e as tags de uma tarefa na Treeview"""
         tags = ()
-        if tarefa[4] == 'Alta':
+        if tarefa.prioridade == 'Alta':
             tags = ('alta',)
-        elif tarefa[4] == 'Média':
+        elif tarefa.prioridade == 'Média':
             tags = ('media',)
-        elif tarefa[4] == 'Baixa':
+        elif tarefa.prioridade == 'Baixa':
             tags = ('baixa',)
-            
-        return self.tree.insert(parent, 'end', values=(
-            tarefa[0],  # ID
-            tarefa[1],  # Título
-            tarefa[3],  # Categoria
-            tarefa[4],  # Prioridade
-            tarefa[5],  # Estado
-            tarefa[7]   # Data Vencimento
-        ), tags=tags)
+        
+        # A indentação das subtarefas é feita pela própria árvore
+        return tarefa.titulo, (
+            tarefa.id,
+            tarefa.categoria,
+            tarefa.prioridade,
+            tarefa.estado,
+            tarefa.data_vencimento
+        ), tags
 
     def _mostrar_menu_contexto(self, event):
         """Mostra o menu de contexto"""
@@ -726,17 +1444,81 @@ Razão: {analise['justificativas']['data_vencimento']}
         if not tarefas:
             return
         
-        tarefa = {
-            'titulo': tarefas[0][1],
-            'descricao': tarefas[0][2],
-            'categoria': tarefas[0][3],
-            'prioridade': tarefas[0][4]
-        }
+        tarefa = tarefas[0].para_dict(('titulo', 'descricao', 'categoria', 'prioridade'))
+        
+        # Obter sugestões da IA em segundo plano
+        future = self.ai_async.sugerir_melhorias(tarefa)
+        dialog = self._mostrar_progresso_ia("A analisar a tarefa com IA...", future)
+        
+        def ao_concluir(sugestoes):
+            dialog.destroy()
+            if sugestoes:
+                self._mostrar_sugestoes_melhoria(sugestoes, task_id)
+        
+        def ao_falhar(erro):
+            dialog.destroy()
+            Messagebox.show_error(
+                title="Erro",
+                message=f"Erro ao analisar tarefa: {str(erro)}",
+                parent=self.root,
+                position=self._get_center_position()
+            )
+        
+        self.despachante.quando_concluir(future, ao_concluir, ao_falhar)
+
+    def _categorizar_tarefas_ia(self):
+        """Categoriza com IA, em lote, todas as tarefas que ainda não têm categoria"""
+        cancelado = threading.Event()
+        
+        def categorizar():
+            tarefas = self.task_manager.obter_tarefas_sem_categoria(
+                colunas=('titulo', 'descricao', 'prioridade'))
+            if not tarefas:
+                return 0, 0, 0
+            sugestoes, falhados = self.ai_analyzer.categorizar_tarefas(
+                [tarefa.para_dict(('id', 'titulo', 'descricao')) for tarefa in tarefas], cancelado)
+            if cancelado.is_set():
+                return None
+            # A prioridade sugerida só é usada nas tarefas que ainda não têm uma
+            sem_prioridade = {tarefa.id for tarefa in tarefas if not tarefa.prioridade}
+            atualizacoes = [
+                (task_id, {campo: valor for campo, valor in sugestao.items()
+                           if campo == 'categoria' or task_id in sem_prioridade})
+                for task_id, sugestao in sugestoes.items()
+            ]
+            return len(tarefas), self.task_manager.atualizar_tarefas_em_lote(atualizacoes), falhados
+        
+        future = self.ai_async.submeter(categorizar)
+        dialog = self._mostrar_progresso_ia("A categorizar as tarefas com IA...", future,
+                                            ao_cancelar=cancelado.set)
+        
+        def ao_concluir(resultado):
+            dialog.destroy()
+            if resultado is None:
+                return
+            total, atualizadas, falhados = resultado
+            self._sincronizar()
+            mensagem = (f"{atualizadas} de {total} tarefas sem categoria foram categorizadas."
+                        if total else "Não há tarefas sem categoria.")
+            if falhados:
+                mensagem += f"\n{falhados} pedidos à IA falharam; tente novamente mais tarde."
+            Messagebox.show_info(
+                title="Categorização",
+                message=mensagem,
+                parent=self.root,
+                position=self._get_center_position()
+            )
+        
+        def ao_falhar(erro):
+            dialog.destroy()
+            Messagebox.show_error(
+                title="Erro",
+                message=f"Erro ao categorizar tarefas: {str(erro)}",
+                parent=self.root,
+                position=self._get_center_position()
+            )
         
-        # Obter sugestões da IA
-        sugestoes = self.ai_analyzer.sugerir_melhorias(tarefa)
-        if sugestoes:
-            self._mostrar_sugestoes_melhoria(sugestoes, task_id)
+        self.despachante.quando_concluir(future, ao_concluir, ao_falhar)
 
     def _mostrar_sugestoes_melhoria(self, sugestoes, task_id):
         """Mostra uma janela com sugestões de melhoria"""
@@ -805,7 +1587,7 @@ Subtarefas Sugeridas:"""
                     prioridade=ajustes.get('prioridade'),
                     categoria=ajustes.get('categoria')
                 )
-            self._atualizar_lista_tarefas()
+            self._atualizar_lista_tarefas(pais_alterados=[self._pai_da_tarefa(task_id)])
             
             # Perguntar sobre criação de subtarefas
             subtarefas = sugestoes.get('subtarefas_sugeridas', [])
@@ -816,16 +1598,16 @@ Subtarefas Sugeridas:"""
                     parent=self.root,
                     position=self._get_center_position()
                 ) == "Yes":
-                    for subtarefa in subtarefas:
-                        self.task_manager.criar_tarefa(
-                            titulo=subtarefa,
-                            descricao="",
-                            categoria=ajustes.get('categoria', 'Pessoal'),
-                            prioridade=ajustes.get('prioridade', 'Média'),
-                            data_vencimento="",
-                            parent_id=task_id
-                        )
-                    self._atualizar_lista_tarefas()
+                    self.task_manager.criar_tarefas_em_lote([{
+                        'titulo': subtarefa,
+                        'descricao': "",
+                        'categoria': ajustes.get('categoria', 'Pessoal'),
+                        'prioridade': ajustes.get('prioridade', 'Média'),
+                        'data_vencimento': "",
+                        'parent_id': task_id
+                    } for subtarefa in subtarefas])
+                    self.ai_async.submeter(self.task_manager.atualizar_indice_similaridade)
+                    self._atualizar_lista_tarefas(pais_alterados=[task_id])
 
     def _mudar_estado(self, novo_estado):
         """Muda o estado da tarefa selecionada"""
@@ -842,7 +1624,7 @@ Subtarefas Sugeridas:"""
         task_id = self.tree.item(selected_item)['values'][0]
         try:
             self.task_manager.atualizar_tarefa(task_id, estado=novo_estado)
-            self._atualizar_lista_tarefas()
+            self._atualizar_lista_tarefas(pais_alterados=[self._pai_da_tarefa(task_id)])
             Messagebox.show_info(
                 title="Sucesso",
                 message=f"Estado da tarefa alterado para '{novo_estado}'!",
@@ -870,7 +1652,7 @@ Subtarefas Sugeridas:"""
             return
         
         task_id = self.tree.item(selected_item)['values'][0]
-        task_titulo = self.tree.item(selected_item)['values'][1]
+        task_titulo = self.lista.linha(task_id).titulo
         
         resposta = Messagebox.show_question(
             title="Confirmar Eliminação",
@@ -882,7 +1664,7 @@ Subtarefas Sugeridas:"""
         if resposta == "Yes":  # Só elimina se a resposta for "Yes"
             try:
                 if self.task_manager.eliminar_tarefa(task_id):
-                    self._atualizar_lista_tarefas()
+                    self._atualizar_lista_tarefas(pais_alterados=[self._pai_da_tarefa(task_id)])
                     Messagebox.show_info(
                         title="Sucesso",
                         message="Tarefa eliminada com sucesso!",
@@ -958,6 +1740,15 @@ Subtarefas Sugeridas:"""
                 position=self._get_center_position()
             )
 
+    def _mensagem_importacao(self, resumo):
+        """Formata o resumo de uma importação"""
+        return (
+            "Tarefas importadas com sucesso!\n\n"
+            f"Novas: {resumo['novas']}\n"
+            f"Já existentes (ignoradas): {resumo['duplicadas']}\n"
+            f"Em conflito com o mesmo ID (ignoradas): {resumo['conflitos']}"
+        )
+
     def _importar_json(self):
         """Função para importar de JSON com seleção de arquivo"""
         try:
@@ -968,11 +1759,14 @@ Subtarefas Sugeridas:"""
             )
             
             if filename:  # Se um arquivo foi selecionado
-                if self.task_manager.importar_de_json(filename, pasta_personalizada=True):
+                resumo = self.task_manager.importar_de_json(filename, pasta_personalizada=True)
+                if resumo:
+                    # As tarefas importadas ficam pendentes no índice de semelhança
+                    self.ai_async.submeter(self.task_manager.atualizar_indice_similaridade)
                     self._atualizar_lista_tarefas()
                     Messagebox.show_info(
                         title="Sucesso",
-                        message="Tarefas importadas com sucesso!",
+                        message=self._mensagem_importacao(resumo),
                         parent=self.root,
                         position=self._get_center_position()
                     )
@@ -994,11 +1788,14 @@ Subtarefas Sugeridas:"""
             )
             
             if filename:  # Se um arquivo foi selecionado
-                if self.task_manager.importar_de_csv(filename, pasta_personalizada=True):
+                resumo = self.task_manager.importar_de_csv(filename, pasta_personalizada=True)
+                if resumo:
+                    # As tarefas importadas ficam pendentes no índice de semelhança
+                    self.ai_async.submeter(self.task_manager.atualizar_indice_similaridade)
                     self._atualizar_lista_tarefas()
                     Messagebox.show_info(
                         title="Sucesso",
-                        message="Tarefas importadas com sucesso!",
+                        message=self._mensagem_importacao(resumo),
                         parent=self.root,
                         position=self._get_center_position()
                     )
@@ -1010,46 +1807,62 @@ Subtarefas Sugeridas:"""
                 position=self._get_center_position()
             )
 
-    def _filtrar_tarefas(self):
-        """Filtra as tarefas com base nos critérios de pesquisa e filtros"""
-        # Limpar a lista atual
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-        
-        # Obter todas as tarefas
-        tarefas = self.task_manager.obter_todas_tarefas()
-        termo_pesquisa = self.var_pesquisa.get().lower()
+    def _filtros_ativos(self):
+        """Verifica se há pesquisa ou filtros aplicados à lista"""
+        return bool(
+            self.var_pesquisa.get().strip()
+            or self.var_filtro_estado.get() != "Todos"
+            or self.var_filtro_prioridade.get() != "Todas"
+        )
+
+    def _agendar_filtro(self):
+        """Filtra a lista só quando o utilizador para de escrever ou de mudar os filtros"""
+        if self._filtro_agendado is not None:
+            self.root.after_cancel(self._filtro_agendado)
+        self._filtro_agendado = self.root.after(self.atraso_filtros_ms, self._filtrar_tarefas)
+
+    def _criterios_filtro(self):
+        """Converte a pesquisa, os filtros e a ordenação nos argumentos de obter_pagina_tarefas"""
+        criterios = {'texto': self.var_pesquisa.get().strip() or None}
+        
         estado_filtro = self.var_filtro_estado.get()
+        if estado_filtro != "Todos":
+            # Os estados são guardados em minúsculas, mas os importados podem vir como na lista
+            criterios['estado'] = sorted({estado_filtro.lower(), estado_filtro})
         prioridade_filtro = self.var_filtro_prioridade.get()
+        if prioridade_filtro != "Todas":
+            criterios['prioridade'] = prioridade_filtro
+        
+        # Sem ordenação escolhida, os resultados da pesquisa ficam por relevância
+        if self.ordem_atual['coluna'] != 'ID' or self.ordem_atual['reverso']:
+            criterios['coluna'] = CAMPOS_COLUNAS[self.ordem_atual['coluna']]
+            criterios['reverso'] = self.ordem_atual['reverso']
+        return criterios
+
+    def _filtrar_tarefas(self):
+        """Filtra as tarefas com base nos critérios de pesquisa e filtros, fora da thread do Tk"""
+        self._filtro_agendado = None
+        if self._pedido_filtro is not None:
+            self.despachante.cancelar(self._pedido_filtro)
+            self._pedido_filtro = None
+        
+        if not self._filtros_ativos():
+            # A hierarquia em cache continua válida
+            self._atualizar_lista_tarefas(pais_alterados=())
+            return
         
-        for tarefa in tarefas:
-            # Aplicar filtros
-            if estado_filtro != "Todos" and tarefa[5].lower() != estado_filtro.lower():
-                continue
-            if prioridade_filtro != "Todas" and tarefa[4] != prioridade_filtro:
-                continue
-            
-            # Aplicar pesquisa
-            if termo_pesquisa and termo_pesquisa not in tarefa[1].lower():  # Pesquisa por título
-                continue
-                
-            # Definir estilo baseado na prioridade
-            tags = ()
-            if tarefa[4] == 'Alta':
-                tags = ('alta',)
-            elif tarefa[4] == 'Média':
-                tags = ('media',)
-            elif tarefa[4] == 'Baixa':
-                tags = ('baixa',)
-                
-            self.tree.insert('', 'end', values=(
-                tarefa[0],  # ID
-                tarefa[1],  # Título
-                tarefa[3],  # Categoria
-                tarefa[4],  # Prioridade
-                tarefa[5],  # Estado
-                tarefa[7]   # Data Vencimento
-            ), tags=tags)
+        # Só o pedido mais recente chega à lista
+        self._pedido_filtro = self.executor_filtros.submit(
+            FontePaginadaTarefas, self.task_manager, self._criterios_filtro(), CAMPOS_LISTA)
+        self.despachante.quando_concluir(
+            self._pedido_filtro,
+            self._mostrar_tarefas_filtradas,
+            lambda erro: print(f"Erro ao filtrar tarefas: {erro}")
+        )
+
+    def _mostrar_tarefas_filtradas(self, fonte):
+        self._pedido_filtro = None
+        self.lista.definir_fonte(fonte, manter_posicao=False)
 
     def _mudar_tema(self, tema):
         """Muda o tema da aplicação"""
@@ -1063,24 +1876,28 @@ Subtarefas Sugeridas:"""
         
     def _mostrar_estatisticas(self):
         """Mostra estatísticas das tarefas"""
-        tarefas = self.task_manager.obter_todas_tarefas()
-        total = len(tarefas)
-        
-        # Contadores
-        pendentes = sum(1 for t in tarefas if t[5].lower() == 'pendente')
-        em_progresso = sum(1 for t in tarefas if t[5].lower() == 'em progresso')
-        concluidas = sum(1 for t in tarefas if t[5].lower() == 'concluída')
+        # Contadores mantidos pela base de dados, sem ler as tarefas
+        estatisticas = self.task_manager.estatisticas()
+        total = estatisticas['total']
+        
+        # Estados (sem distinguir maiúsculas, como nos filtros)
+        estados = {}
+        for estado, count in estatisticas['por_estado'].items():
+            estados[estado.lower()] = estados.get(estado.lower(), 0) + count
+        pendentes = estados.get('pendente', 0)
+        em_progresso = estados.get('em progresso', 0)
+        concluidas = estados.get('concluída', 0)
         
         # Prioridades
-        alta = sum(1 for t in tarefas if t[4] == 'Alta')
-        media = sum(1 for t in tarefas if t[4] == 'Média')
-        baixa = sum(1 for t in tarefas if t[4] == 'Baixa')
+        alta = estatisticas['por_prioridade'].get('Alta', 0)
+        media = estatisticas['por_prioridade'].get('Média', 0)
+        baixa = estatisticas['por_prioridade'].get('Baixa', 0)
         
         # Categorias
-        categorias = {}
-        for t in tarefas:
-            cat = t[3]
-            categorias[cat] = categorias.get(cat, 0) + 1
+        categorias = estatisticas['por_categoria']
+        
+        # Tempo de conclusão (mediana e percentil 90), em horas
+        mediana, p90 = estatisticas['tempo_conclusao'].values()
         
         # Criar janela de estatísticas
         stats_window = ttk.Toplevel(self.root)
@@ -1124,6 +1941,12 @@ Subtarefas Sugeridas:"""
         ttk.Label(main_frame, text=f"Pendentes: {pendentes}").pack()
         ttk.Label(main_frame, text=f"Em Progresso: {em_progresso}").pack()
         ttk.Label(main_frame, text=f"Concluídas: {concluidas}").pack()
+        ttk.Label(main_frame, text=f"Em atraso: {estatisticas['atrasadas']}").pack()
+        if mediana is not None:
+            ttk.Label(
+                main_frame,
+                text=f"Tempo de conclusão: mediana {mediana:.1f} h, 90% até {p90:.1f} h"
+            ).pack()
         
         # Prioridades
         ttk.Label(
@@ -1199,7 +2022,7 @@ Subtarefas Sugeridas:"""
             return
         
         parent_id = self.tree.item(selected_item)['values'][0]
-        parent_titulo = self.tree.item(selected_item)['values'][1]
+        parent_titulo = self.lista.linha(parent_id).titulo
         
         # Criar janela de subtarefa
         subtask_window = ttk.Toplevel(self.root)
@@ -1301,7 +2124,7 @@ Subtarefas Sugeridas:"""
                     data_vencimento=var_data_vencimento.get(),
                     parent_id=parent_id
                 )
-                self._atualizar_lista_tarefas()
+                self._atualizar_lista_tarefas(pais_alterados=[parent_id])
                 subtask_window.destroy()
                 Messagebox.show_info(
                     title="Sucesso",
@@ -1337,6 +2160,12 @@ Subtarefas Sugeridas:"""
     def _on_closing(self):
         """Handler para quando a janela é fechada"""
         try:
+            # Cancelar pedidos à IA pendentes e parar a entrega de resultados
+            if self._verificacao_agendada is not None:
+                self.root.after_cancel(self._verificacao_agendada)
+            self.ai_async.encerrar()
+            self.executor_filtros.shutdown(wait=False, cancel_futures=True)
+            self.despachante.parar()
             # Fechar conexão com a base de dados
             self.task_manager.fechar_conexao()
         finally:
@@ -1373,25 +2202,34 @@ Subtarefas Sugeridas:"""
                 _, titulo = comando.split(" ", 1)
                 self.var_titulo.set(titulo)
                 self._adicionar_tarefa()
-                return "Tarefa criada com sucesso!"
+                return f"A analisar e criar a tarefa '{titulo}'..."
             except Exception as e:
                 return f"Erro ao criar tarefa: {str(e)}"
         
         elif comando.startswith("/listar_tarefas"):
-            # Listar todas as tarefas
-            tarefas = self.task_manager.obter_todas_tarefas()
+            # Listar as tarefas uma página de cada vez; "/listar_tarefas mais" continua a listagem
+            continuar = comando.split()[1:] == ["mais"]
+            if continuar and self._token_listagem is None:
+                return "Não há mais tarefas para listar."
+            tarefas, self._token_listagem = self.task_manager.obter_pagina_tarefas(
+                self.tamanho_pagina_listagem,
+                self._token_listagem if continuar else None,
+                colunas=('titulo', 'estado')
+            )
             if not tarefas:
                 return "Não há tarefas registadas."
             
-            resposta = "Tarefas atuais:\n"
+            resposta = "Tarefas atuais:\n" if not continuar else ""
             for t in tarefas:
-                resposta += f"- {t[1]} ({t[5]})\n"
+                resposta += f"- {t.titulo} ({t.estado})\n"
+            if self._token_listagem is not None:
+                resposta += "(escreva /listar_tarefas mais para ver as seguintes)\n"
             return resposta
         
         elif comando.startswith("/ajuda"):
             return """Comandos disponíveis:
 - /criar_tarefa [título]
-- /listar_tarefas
+- /listar_tarefas (e /listar_tarefas mais)
 - /ajuda
 
 Você também pode:
@@ -1422,42 +2260,91 @@ Você também pode:
                 self._adicionar_mensagem_sistema(resposta)
                 return
         
-        # Processar mensagem normal
+        # Processar mensagem normal em segundo plano
         self._mostrar_digitando()
+        tarefas_atuais = lambda: [t.para_dict(('titulo', 'descricao', 'estado', 'prioridade')) for t in self.task_manager.obter_tarefas_relevantes(
+            mensagem, self.ai_analyzer.max_tarefas_contexto)]
         
-        try:
-            # Analisar a mensagem e gerar resposta
-            analise = self.ai_analyzer.analisar_mensagem(
+        if self.var_chat_tempo_real.get():
+            # O texto é acrescentado ao chat à medida que chega da API
+            marca = self._iniciar_resposta_stream()
+            future = self.ai_async.analisar_mensagem_stream(
                 mensagem=mensagem,
-                tarefas_atuais=[{
-                    'titulo': t[1],
-                    'descricao': t[2],
-                    'estado': t[5],
-                    'prioridade': t[4]
-                } for t in self.task_manager.obter_todas_tarefas()]
+                ao_receber=lambda parte: self.despachante.chamar(self._acrescentar_resposta_stream, marca, parte),
+                tarefas_atuais=tarefas_atuais,
+                resumo=self.task_manager.resumo_tarefas
             )
-            
-            # Processar a resposta
-            if isinstance(analise, dict):
-                resposta = analise.get('resposta', 'Desculpe, não consegui processar sua solicitação.')
-                
-                # Verificar se há ações sugeridas
-                acoes = analise.get('acoes_sugeridas', [])
-                if acoes:
-                    resposta += "\n\nAções sugeridas:"
-                    for acao in acoes:
-                        resposta += f"\n- {acao}"
-            else:
-                resposta = "Desculpe, ocorreu um erro ao processar sua mensagem."
-            
-            self._adicionar_mensagem_sistema(resposta)
-            
-        except Exception as e:
-            self._adicionar_mensagem_sistema(
-                "Desculpe, ocorreu um erro ao processar sua mensagem. "
-                "Por favor, tente novamente mais tarde."
+            self.despachante.quando_concluir(
+                future,
+                lambda resposta: self._concluir_resposta_stream(marca, resposta),
+                self._mostrar_erro_ia
             )
-            print(f"Erro ao processar mensagem: {str(e)}")
+            return
         
-        finally:
-            self._esconder_digitando() 
\ No newline at end of file
+        future = self.ai_async.analisar_mensagem(
+            mensagem=mensagem,
+            tarefas_atuais=tarefas_atuais,
+            resumo=self.task_manager.resumo_tarefas
+        )
+        self.despachante.quando_concluir(future, self._mostrar_resposta_ia, self._mostrar_erro_ia)
+    
+    def _iniciar_resposta_stream(self):
+        """Abre no chat uma resposta vazia e retorna a marca onde o texto vai sendo acrescentado"""
+        self._contador_respostas += 1
+        marca = f"resposta_{self._contador_respostas}"
+        self.chat_area.configure(state='normal')
+        self.chat_area.insert('end', "🤖 Assistente: ")
+        # A marca fica antes da linha em branco final; com gravidade à direita
+        # acompanha o texto inserido, mesmo com várias respostas em simultâneo
+        self.chat_area.mark_set(marca, 'end-1c')
+        self.chat_area.mark_gravity(marca, 'left')
+        self.chat_area.insert('end', "\n\n")
+        self.chat_area.mark_gravity(marca, 'right')
+        self.chat_area.see('end')
+        self.chat_area.configure(state='disabled')
+        return marca
+    
+    def _acrescentar_resposta_stream(self, marca, parte):
+        """Acrescenta um bocado de texto a uma resposta em curso"""
+        self._esconder_digitando()
+        self.chat_area.configure(state='normal')
+        self.chat_area.insert(marca, parte)
+        self.chat_area.see(marca)
+        self.chat_area.configure(state='disabled')
+    
+    def _concluir_resposta_stream(self, marca, resposta):
+        """Termina uma resposta transmitida, acrescentando as ações sugeridas"""
+        acoes = self.ai_analyzer.extrair_acoes(resposta)
+        if acoes:
+            self._acrescentar_resposta_stream(
+                marca, "\n\nAções sugeridas:" + "".join(f"\n- {acao}" for acao in acoes))
+        self._esconder_digitando()
+        self.chat_area.mark_unset(marca)
+    
+    def _mostrar_resposta_ia(self, analise):
+        """Mostra no chat a resposta da IA a uma mensagem"""
+        self._esconder_digitando()
+        
+        # Processar a resposta
+        if isinstance(analise, dict):
+            resposta = analise.get('resposta', 'Desculpe, não consegui processar sua solicitação.')
+            
+            # Verificar se há ações sugeridas
+            acoes = analise.get('acoes_sugeridas', [])
+            if acoes:
+                resposta += "\n\nAções sugeridas:"
+                for acao in acoes:
+                    resposta += f"\n- {acao}"
+        else:
+            resposta = "Desculpe, ocorreu um erro ao processar sua mensagem."
+        
+        self._adicionar_mensagem_sistema(resposta)
+    
+    def _mostrar_erro_ia(self, erro):
+        """Mostra no chat um erro no processamento de uma mensagem"""
+        self._esconder_digitando()
+        self._adicionar_mensagem_sistema(
+            "Desculpe, ocorreu um erro ao processar sua mensagem. "
+            "Por favor, tente novamente mais tarde."
+        )
+        print(f"Erro ao processar mensagem: {str(erro)}")
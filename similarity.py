@@ -0,0 +1,87 @@
+import struct
+import zlib
+from task_index import tokenizar
+
+# Assinaturas MinHash com NUM_HASHES valores, divididas em bandas de LINHAS_BANDA valores para
+# o LSH: duas tarefas com semelhança de Jaccard s são candidatas com probabilidade
+# 1 - (1 - s^4)^16 (cerca de 50% para s = 0.5 e 98% para s = 0.75)
+NUM_HASHES = 64
+LINHAS_BANDA = 4
+NUM_BANDAS = NUM_HASHES // LINHAS_BANDA
+TAMANHO_SHINGLE = 3
+
+# Função de dispersão universal (a * x + b) mod p, com constantes fixas para que as
+# assinaturas gravadas continuem válidas entre execuções
+_PRIMO = (1 << 61) - 1
+_A = 0x1A2F3C4D5E6F7081
+_B = 0x0F1E2D3C4B5A6978
+# Desvio somado por cada balde percorrido ao preencher um balde vazio
+_DESVIO = 0x9E3779B9
+_MASCARA = 0xFFFFFFFF
+# Multiplicador ímpar que mistura os valores de uma banda numa chave de 64 bits
+_MISTURA = 0x9E3779B97F4A7C15
+_MASCARA_CHAVE = (1 << 64) - 1
+_FORMATO = f'<{NUM_HASHES}I'
+
+def shingles(titulo, descricao):
+    """Conjunto de sequências de TAMANHO_SHINGLE bytes do texto normalizado da tarefa"""
+    texto = ' '.join(tokenizar(titulo) + tokenizar(descricao)).encode('utf-8')
+    if len(texto) <= TAMANHO_SHINGLE:
+        return {texto} if texto else set()
+    return {texto[i:i + TAMANHO_SHINGLE] for i in range(len(texto) - TAMANHO_SHINGLE + 1)}
+
+def calcular_assinatura(titulo, descricao):
+    """Calcula a assinatura MinHash de uma tarefa, ou None se não tiver texto.
+
+    Usa uma só dispersão por shingle (one permutation hashing): o valor escolhe o balde e
+    cada balde guarda o seu mínimo. Os baldes vazios copiam o balde ocupado seguinte
+    (densificação por rotação), para as posições continuarem comparáveis entre tarefas.
+    """
+    conjunto = shingles(titulo, descricao)
+    if not conjunto:
+        return None
+    # Por ordem decrescente, o último valor de cada balde é o menor
+    valores = sorted(((zlib.crc32(shingle) * _A + _B) % _PRIMO for shingle in conjunto), reverse=True)
+    minimos = {valor % NUM_HASHES: valor // NUM_HASHES for valor in valores}
+    if len(minimos) == NUM_HASHES:
+        return tuple(minimos[balde] & _MASCARA for balde in range(NUM_HASHES))
+
+    # Percorrer os baldes de trás para a frente (duas voltas, por ser circular), guardando
+    # o próximo balde ocupado e a distância até ele
+    assinatura = [0] * NUM_HASHES
+    proximo = None
+    distancia = 0
+    for posicao in range(2 * NUM_HASHES - 1, -1, -1):
+        balde = posicao % NUM_HASHES
+        if balde in minimos:
+            proximo = minimos[balde]
+            distancia = 0
+        else:
+            distancia += 1
+        if posicao < NUM_HASHES:
+            assinatura[balde] = (proximo + distancia * _DESVIO) & _MASCARA
+    return tuple(assinatura)
+
+def chaves_lsh(assinatura):
+    """Retorna uma chave inteira (64 bits, com sinal) por banda da assinatura"""
+    chaves = []
+    for banda in range(NUM_BANDAS):
+        inicio = banda * LINHAS_BANDA
+        chave = banda
+        for valor in assinatura[inicio:inicio + LINHAS_BANDA]:
+            chave = ((chave ^ valor) * _MISTURA) & _MASCARA_CHAVE
+        # Os inteiros do SQLite têm sinal
+        chaves.append(chave - (1 << 64) if chave >> 63 else chave)
+    return chaves
+
+def empacotar(assinatura):
+    """Converte uma assinatura nos bytes gravados na base de dados"""
+    return struct.pack(_FORMATO, *assinatura)
+
+def desempacotar(dados):
+    """Converte os bytes gravados numa assinatura"""
+    return struct.unpack(_FORMATO, dados)
+
+def semelhanca(assinatura, outra):
+    """Estimativa da semelhança de Jaccard entre duas tarefas (fração de posições iguais)"""
+    return sum(1 for a, b in zip(assinatura, outra) if a == b) / NUM_HASHES
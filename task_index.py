@@ -0,0 +1,83 @@
+import heapq
+import math
+import re
+import threading
+import unicodedata
+from collections import Counter, defaultdict
+
+# Palavras demasiado comuns para ajudarem a distinguir tarefas
+PALAVRAS_IGNORADAS = {
+    'a', 'ao', 'aos', 'as', 'com', 'como', 'da', 'das', 'de', 'do', 'dos', 'e', 'em',
+    'na', 'nas', 'no', 'nos', 'o', 'os', 'ou', 'para', 'pela', 'pelo', 'por', 'que',
+    'se', 'sem', 'um', 'uma', 'the', 'and', 'of', 'to'
+}
+
+def tokenizar(texto):
+    """Divide um texto em termos normalizados (minúsculas, sem acentos)"""
+    if not texto:
+        return []
+    texto = unicodedata.normalize('NFKD', texto.lower())
+    texto = ''.join(c for c in texto if not unicodedata.combining(c))
+    return [t for t in re.findall(r'\w+', texto) if len(t) > 1 and t not in PALAVRAS_IGNORADAS]
+
+class TaskIndex:
+    """Índice BM25 em memória sobre o título e a descrição das tarefas, atualizado tarefa a tarefa"""
+
+    def __init__(self, k1=1.5, b=0.75, peso_titulo=2):
+        self.k1 = k1
+        self.b = b
+        self.peso_titulo = peso_titulo
+        self._comprimentos = {}              # task_id -> número de termos
+        self._termos = {}                    # task_id -> Counter dos termos
+        self._postings = defaultdict(dict)   # termo -> {task_id: frequência}
+        self._total_termos = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._comprimentos)
+
+    def adicionar(self, task_id, titulo, descricao):
+        """Indexa uma tarefa, substituindo a versão anterior se já existir"""
+        termos = Counter(tokenizar(titulo) * self.peso_titulo + tokenizar(descricao))
+        with self._lock:
+            self._remover(task_id)
+            self._termos[task_id] = termos
+            self._comprimentos[task_id] = sum(termos.values())
+            self._total_termos += self._comprimentos[task_id]
+            for termo, frequencia in termos.items():
+                self._postings[termo][task_id] = frequencia
+
+    def remover(self, task_id):
+        """Retira uma tarefa do índice"""
+        with self._lock:
+            self._remover(task_id)
+
+    def _remover(self, task_id):
+        termos = self._termos.pop(task_id, None)
+        if termos is None:
+            return
+        self._total_termos -= self._comprimentos.pop(task_id)
+        for termo in termos:
+            postings = self._postings[termo]
+            postings.pop(task_id, None)
+            if not postings:
+                del self._postings[termo]
+
+    def pesquisar(self, texto, k=10):
+        """Retorna até k pares (task_id, pontuação) das tarefas mais relevantes para o texto"""
+        consulta = set(tokenizar(texto))
+        with self._lock:
+            total = len(self._comprimentos)
+            if not consulta or not total:
+                return []
+            media = self._total_termos / total or 1
+            pontuacoes = defaultdict(float)
+            for termo in consulta:
+                postings = self._postings.get(termo)
+                if not postings:
+                    continue
+                idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+                for task_id, frequencia in postings.items():
+                    normalizacao = self.k1 * (1 - self.b + self.b * self._comprimentos[task_id] / media)
+                    pontuacoes[task_id] += idf * frequencia * (self.k1 + 1) / (frequencia + normalizacao)
+        return heapq.nlargest(k, pontuacoes.items(), key=lambda item: (item[1], -item[0]))
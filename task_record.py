@@ -0,0 +1,52 @@
+import sys
+
+# Colunas da tabela tasks, pela ordem do esquema
+CAMPOS_TAREFA = ('id', 'titulo', 'descricao', 'categoria', 'prioridade', 'estado',
+                 'data_criacao', 'data_vencimento', 'data_conclusao', 'parent_id')
+
+# Colunas lidas pelas vistas de lista, que não mostram a descrição
+CAMPOS_LISTA = tuple(campo for campo in CAMPOS_TAREFA if campo != 'descricao')
+
+# Campos com poucos valores distintos: cada valor fica guardado uma só vez em memória
+CAMPOS_INTERNADOS = ('categoria', 'prioridade', 'estado')
+
+class Task:
+    """Registo compacto de uma tarefa, com acesso por atributo.
+
+    Os campos que não foram lidos (numa consulta com projeção de colunas) ficam a None.
+    """
+
+    __slots__ = CAMPOS_TAREFA
+
+    def __init__(self, id=None, titulo=None, descricao=None, categoria=None, prioridade=None,
+                 estado=None, data_criacao=None, data_vencimento=None, data_conclusao=None,
+                 parent_id=None):
+        self.id = id
+        self.titulo = titulo
+        self.descricao = descricao
+        self.categoria = sys.intern(categoria) if categoria else categoria
+        self.prioridade = sys.intern(prioridade) if prioridade else prioridade
+        self.estado = sys.intern(estado) if estado else estado
+        self.data_criacao = data_criacao
+        self.data_vencimento = data_vencimento
+        self.data_conclusao = data_conclusao
+        self.parent_id = parent_id
+
+    @classmethod
+    def da_linha(cls, colunas, linha):
+        """Cria uma tarefa a partir de uma linha e dos nomes das suas colunas"""
+        return cls(**dict(zip(colunas, linha)))
+
+    def para_dict(self, campos=CAMPOS_TAREFA):
+        """Retorna os campos indicados num dicionário, pela ordem dada"""
+        return {campo: getattr(self, campo) for campo in campos}
+
+    def __eq__(self, outra):
+        if not isinstance(outra, Task):
+            return NotImplemented
+        return all(getattr(self, campo) == getattr(outra, campo) for campo in CAMPOS_TAREFA)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"Task(id={self.id!r}, titulo={self.titulo!r}, estado={self.estado!r})"
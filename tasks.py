@@ -2,70 +2,305 @@ from datetime import datetime
 import json
 import csv
 import os
+import threading
 from database import Database
+from task_index import TaskIndex
+from classifier import ClassificadorTarefas
+from task_record import CAMPOS_TAREFA
+
+# Campos escritos nas exportações (a hierarquia não é exportada)
+CAMPOS_EXPORTACAO = CAMPOS_TAREFA[:-1]
 
 class TaskManager:
     def __init__(self):
         self.db = Database()
+        # Índice de relevância para o contexto da IA, construído na primeira pesquisa
+        self._indice = None
+        self._indice_lock = threading.Lock()
+        # Protege a publicação do índice e as atualizações feitas pelas operações de escrita
+        self._indice_escrita_lock = threading.Lock()
+        # Classificador local de categoria e prioridade, gravado ao lado da base de dados
+        self.caminho_classificador = os.path.join(os.path.dirname(self.db.db_path), 'classificador.json')
+        self._classificador = None
+        self._classificador_alterado = False
+        self._classificador_lock = threading.Lock()
 
     def __del__(self):
         """Destrutor para garantir que a conexão é fechada"""
         if hasattr(self, 'db'):
-            self.db.conn.close()
+            self.db.close()
 
     def fechar_conexao(self):
         """Fecha a conexão com a base de dados"""
+        self.guardar_classificador()
         if hasattr(self, 'db'):
-            self.db.conn.close()
+            self.db.close()
 
     def criar_tarefa(self, titulo, descricao, categoria, prioridade, data_vencimento, parent_id=None):
         """Cria uma nova tarefa"""
-        return self.db.add_task(titulo, descricao, categoria, prioridade, data_vencimento, parent_id)
+        task_id = self.db.add_task(titulo, descricao, categoria, prioridade, data_vencimento, parent_id)
+        with self._indice_escrita_lock:
+            if self._indice is not None:
+                self._indice.adicionar(task_id, titulo, descricao)
+        return task_id
+
+    def criar_tarefas_em_lote(self, tarefas, tamanho_lote=500):
+        """Cria várias tarefas numa única transação e retorna os novos ids"""
+        # O índice pode ser publicado durante a escrita, por isso as tarefas ficam numa lista
+        tarefas = list(tarefas)
+        ids = self.db.add_tasks_bulk(tarefas, chunk_size=tamanho_lote)
+        with self._indice_escrita_lock:
+            if self._indice is not None:
+                for task_id, tarefa in zip(ids, tarefas):
+                    self._indice.adicionar(task_id, tarefa['titulo'], tarefa.get('descricao'))
+        return ids
 
-    def obter_todas_tarefas(self, incluir_subtarefas=True):
-        """Retorna todas as tarefas"""
-        tarefas = self.db.get_all_tasks()
+    def obter_todas_tarefas(self, incluir_subtarefas=True, colunas=None):
+        """Retorna todas as tarefas, opcionalmente só com algumas colunas"""
         if not incluir_subtarefas:
             # Retornar apenas tarefas principais (sem parent_id)
-            try:
-                return [t for t in tarefas if len(t) > 9 and t[9] is None]
-            except IndexError:
-                # Se houver erro de índice, significa que a estrutura antiga ainda está em uso
-                return tarefas
-        return tarefas
+            return self.db.get_tasks_by_filter(parent_id__isnull=True, columns=colunas)
+        return self.db.get_all_tasks(columns=colunas)
 
     def atualizar_tarefa(self, task_id, **kwargs):
         """Atualiza uma tarefa existente"""
         if 'estado' in kwargs and kwargs['estado'] == 'concluída':
             kwargs['data_conclusao'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        return self.db.update_task(task_id, **kwargs)
+        atualizada = self.db.update_task(task_id, **kwargs)
+        if atualizada and ('titulo' in kwargs or 'descricao' in kwargs):
+            with self._indice_escrita_lock:
+                if self._indice is not None:
+                    for tarefa in self.db.get_tasks_by_filter(id=task_id):
+                        self._indice.adicionar(tarefa.id, tarefa.titulo, tarefa.descricao)
+        return atualizada
+
+    def atualizar_tarefas_em_lote(self, atualizacoes):
+        """Atualiza várias tarefas numa única transação; atualizacoes são pares (task_id, {campo: valor})"""
+        data_conclusao = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        atualizacoes = [(task_id, dict(campos, data_conclusao=data_conclusao)
+                         if campos.get('estado') == 'concluída' else campos)
+                        for task_id, campos in atualizacoes]
+        total = self.db.update_tasks_bulk(atualizacoes)
+        reindexar = [task_id for task_id, campos in atualizacoes
+                     if 'titulo' in campos or 'descricao' in campos]
+        if total and reindexar:
+            with self._indice_escrita_lock:
+                if self._indice is not None:
+                    for tarefa in self.db.get_tasks_by_ids(reindexar, columns=('titulo', 'descricao')).values():
+                        self._indice.adicionar(tarefa.id, tarefa.titulo, tarefa.descricao)
+        return total
 
     def eliminar_tarefa(self, task_id):
         """Elimina uma tarefa"""
-        return self.db.delete_task(task_id)
+        eliminada = self.db.delete_task(task_id)
+        if eliminada:
+            with self._indice_escrita_lock:
+                if self._indice is not None:
+                    self._indice.remover(task_id)
+        return eliminada
+
+    def filtrar_tarefas(self, texto=None, coluna=None, reverso=False, limite=None, colunas=None, **filtros):
+        """Filtra tarefas com base em critérios específicos (ver Database.get_tasks_by_filter),
+        opcionalmente restritas a uma pesquisa de texto e ordenadas por uma coluna"""
+        return self.db.get_tasks_by_filter(text=texto, order_by=coluna, reverse=reverso,
+                                           limit=limite, columns=colunas, **filtros)
+
+    def pesquisar_tarefas(self, texto, limite=None, colunas=None, **filtros):
+        """Pesquisa tarefas pelo título e pela descrição (FTS5), das mais relevantes para as menos.
+
+        Ignora acentos e trata cada termo como prefixo; sem termos retorna uma lista vazia.
+        Para ordenar por uma coluna ou paginar, usar filtrar_tarefas ou obter_pagina_tarefas
+        com texto=.
+        """
+        return self.db.search_tasks(texto, limit=limite, columns=colunas, **filtros)
+
+    def obter_pagina_tarefas(self, tamanho=200, token=None, texto=None, coluna=None, reverso=False,
+                             colunas=None, **filtros):
+        """Retorna uma página de tarefas e o token para pedir a seguinte (None na última página)"""
+        return self.db.get_tasks_page(tamanho, token, text=texto, order_by=coluna, reverse=reverso,
+                                      columns=colunas, **filtros)
+
+    def obter_tarefas_sem_categoria(self, colunas=None):
+        """Retorna as tarefas sem categoria (nula ou vazia)"""
+        return (self.db.get_tasks_by_filter(categoria__isnull=True, columns=colunas)
+                + self.db.get_tasks_by_filter(categoria='', columns=colunas))
+
+    def contar_tarefas(self, texto=None, **filtros):
+        """Conta as tarefas que correspondem à pesquisa e aos filtros"""
+        return self.db.count_tasks(text=texto, **filtros)
+
+    def _obter_indice(self):
+        """Retorna o índice de relevância, construindo-o a partir da base de dados se necessário.
+
+        As tarefas gravadas durante a leitura são aplicadas a partir do registo de alterações;
+        a última parte é feita já com as operações de escrita em espera, e só depois de
+        publicado o índice passa a ser atualizado por elas.
+        """
+        with self._indice_lock:
+            while self._indice is None:
+                revisao = self.db.get_revision()
+                indice = TaskIndex()
+                for tarefa in self.db.iter_tasks(columns=('titulo', 'descricao')):
+                    indice.adicionar(tarefa.id, tarefa.titulo, tarefa.descricao)
+                revisao = self._atualizar_indice_desde(indice, revisao)
+                if revisao is None:
+                    # O registo já não chega ao início da leitura: ler tudo de novo
+                    continue
+                with self._indice_escrita_lock:
+                    if self._atualizar_indice_desde(indice, revisao) is not None:
+                        self._indice = indice
+        return self._indice
 
-    def filtrar_tarefas(self, **filtros):
-        """Filtra tarefas com base em critérios específicos"""
-        return self.db.get_tasks_by_filter(**filtros)
+    def _atualizar_indice_desde(self, indice, revisao):
+        """Aplica ao índice as tarefas alteradas depois da revisão indicada e retorna a revisão
+        atual, ou None se o registo de alterações já não chegar tão atrás"""
+        atual, operacoes = self.db.get_changes_since(revisao)
+        if operacoes is None:
+            return None
+        tarefas = self.db.get_tasks_by_ids(operacoes, columns=('titulo', 'descricao'))
+        for task_id in operacoes:
+            tarefa = tarefas.get(task_id)
+            if tarefa is None:
+                indice.remover(task_id)
+            else:
+                indice.adicionar(task_id, tarefa.titulo, tarefa.descricao)
+        return atual
+
+    def obter_tarefas_relevantes(self, texto, k=10):
+        """Retorna as k tarefas mais relevantes para o texto, da mais para a menos relevante"""
+        ids = [task_id for task_id, _ in self._obter_indice().pesquisar(texto, k)]
+        tarefas = self.db.get_tasks_by_ids(ids)
+        return [tarefas[task_id] for task_id in ids if task_id in tarefas]
+
+    def _obter_classificador(self, esperar=True):
+        """Retorna o classificador local, lido do disco e atualizado com as alterações desde então.
+
+        Com esperar=False não lê nem treina nada: retorna o classificador já em memória, tal
+        como estiver, ou None se ainda não tiver sido carregado.
+        """
+        if not esperar:
+            return self._classificador
+        with self._classificador_lock:
+            classificador = self._classificador
+            if classificador is None:
+                classificador = (ClassificadorTarefas.carregar(self.caminho_classificador)
+                                 or ClassificadorTarefas())
+            self._classificador = self._sincronizar_classificador(classificador)
+            return self._classificador
+
+    def _sincronizar_classificador(self, classificador):
+        """Aprende as tarefas criadas, alteradas ou eliminadas desde a revisão do classificador.
+
+        Retorna o classificador atualizado; quando é preciso treinar de novo, o treino é feito
+        num classificador novo, para as sugestões sem espera nunca verem um modelo a meio.
+        """
+        colunas = ('titulo', 'descricao', 'categoria', 'prioridade')
+        if classificador.revisao is None:
+            revisao, operacoes = self.db.get_revision(), None
+        else:
+            revisao, operacoes = self.db.get_changes_since(classificador.revisao)
+
+        if operacoes is None:
+            # Sem modelo gravado, ou o registo de alterações já não chega tão atrás: treinar de novo
+            classificador = ClassificadorTarefas(peso_titulo=classificador.peso_titulo)
+            for tarefa in self.db.iter_tasks(columns=colunas):
+                classificador.adicionar(tarefa.id, tarefa.titulo, tarefa.descricao,
+                                        tarefa.categoria, tarefa.prioridade)
+        elif operacoes:
+            tarefas = self.db.get_tasks_by_ids(operacoes, columns=colunas)
+            for task_id in operacoes:
+                tarefa = tarefas.get(task_id)
+                if tarefa is None:
+                    classificador.remover(task_id)
+                else:
+                    classificador.adicionar(task_id, tarefa.titulo, tarefa.descricao,
+                                            tarefa.categoria, tarefa.prioridade)
+        elif classificador.revisao == revisao:
+            return classificador
+        classificador.revisao = revisao
+        self._classificador_alterado = True
+        return classificador
+
+    def preparar_classificador(self):
+        """Carrega e atualiza o classificador local, para as sugestões seguintes serem imediatas"""
+        self._obter_classificador()
+
+    def sugerir_classificacao(self, titulo, descricao, esperar=True):
+        """Sugere categoria e prioridade com o classificador local.
+
+        Retorna {campo: (valor, confiança)}; o valor é None enquanto não houver tarefas suficientes.
+        Com esperar=False usa o classificador em memória sem o atualizar (para não bloquear a
+        interface) e retorna None se ainda não estiver carregado; preparar_classificador
+        atualiza-o numa thread de fundo.
+        """
+        classificador = self._obter_classificador(esperar)
+        if classificador is None:
+            return None
+        return classificador.sugerir(titulo, descricao)
+
+    def guardar_classificador(self):
+        """Grava o classificador local no disco, se tiver mudado"""
+        with self._classificador_lock:
+            if self._classificador is None or not self._classificador_alterado:
+                return
+            try:
+                self._classificador.guardar(self.caminho_classificador)
+                self._classificador_alterado = False
+            except OSError as e:
+                print(f"Erro ao guardar o classificador: {str(e)}")
 
-    def exportar_para_json(self, filename, pasta_personalizada=False):
-        """Exporta todas as tarefas para um arquivo JSON"""
+    def obter_tarefas_similares(self, titulo, descricao=None, limite=5, semelhanca_minima=0.5, excluir=None):
+        """Retorna até limite pares (tarefa, semelhança) das tarefas com texto quase igual, pelo índice MinHash"""
+        return self.db.find_similar_tasks(titulo, descricao, limit=limite, min_similarity=semelhanca_minima,
+                                          exclude_id=excluir)
+
+    def atualizar_indice_similaridade(self):
+        """Indexa as tarefas ainda sem assinatura (anteriores ao índice ou gravadas por outros processos)"""
+        return self.db.update_similarity_index()
+
+    def versao_dados(self):
+        """Valor que muda sempre que outra conexão ou processo grava na base de dados"""
+        return self.db.get_data_version()
+
+    def revisao_atual(self):
+        """Retorna a revisão mais recente do registo de alterações"""
+        return self.db.get_revision()
+
+    def obter_alteracoes(self, desde):
+        """Retorna (revisão, alteradas, eliminadas) desde uma revisão: as tarefas inseridas ou
+        atualizadas, num dicionário por id, e os ids eliminados. Se o registo já não cobrir a
+        revisão, alteradas e eliminadas vêm a None e tudo deve ser recarregado."""
+        revisao, operacoes = self.db.get_changes_since(desde)
+        if operacoes is None:
+            # O índice de relevância também pode estar desatualizado
+            with self._indice_escrita_lock:
+                self._indice = None
+            return revisao, None, None
+        
+        eliminadas = {task_id for task_id, operacao in operacoes.items() if operacao == 'delete'}
+        alteradas = self.db.get_tasks_by_ids(task_id for task_id in operacoes if task_id not in eliminadas)
+        with self._indice_escrita_lock:
+            if self._indice is not None:
+                for task_id in eliminadas:
+                    self._indice.remover(task_id)
+                for tarefa in alteradas.values():
+                    self._indice.adicionar(tarefa.id, tarefa.titulo, tarefa.descricao)
+        return revisao, alteradas, eliminadas
+
+    def resumo_tarefas(self):
+        """Retorna um resumo compacto: total e contagens por estado, prioridade e categoria"""
+        return self.db.get_task_summary()
+
+    def estatisticas(self, percentis=(0.5, 0.9)):
+        """Retorna o resumo das tarefas, as atrasadas e os percentis do tempo de conclusão (em horas)"""
+        estatisticas = self.db.get_task_summary()
+        estatisticas['atrasadas'] = self.db.get_overdue_count()
+        estatisticas['tempo_conclusao'] = self.db.get_completion_percentiles(percentis)
+        return estatisticas
+
+    def exportar_para_json(self, filename, pasta_personalizada=False, tamanho_bloco=500):
+        """Exporta todas as tarefas para um arquivo JSON, escrevendo-as em fluxo"""
         try:
-            tarefas = self.obter_todas_tarefas()
-            dados = []
-            for tarefa in tarefas:
-                dados.append({
-                    'id': tarefa[0],
-                    'titulo': tarefa[1],
-                    'descricao': tarefa[2],
-                    'categoria': tarefa[3],
-                    'prioridade': tarefa[4],
-                    'estado': tarefa[5],
-                    'data_criacao': tarefa[6],
-                    'data_vencimento': tarefa[7],
-                    'data_conclusao': tarefa[8]
-                })
-            
             if not pasta_personalizada:
                 # Comportamento original - salvar na pasta data
                 if not os.path.exists('data'):
@@ -74,18 +309,27 @@ class TaskManager:
             else:
                 # Usar o caminho completo fornecido
                 caminho_arquivo = filename
-                
+            
+            # O array é escrito elemento a elemento, com o mesmo formato de
+            # json.dump(..., indent=4), e as tarefas são lidas por páginas, para a
+            # memória não crescer com a tabela
             with open(caminho_arquivo, 'w', encoding='utf-8') as f:
-                json.dump(dados, f, ensure_ascii=False, indent=4)
+                f.write('[')
+                separador = '\n'
+                for tarefa in self.db.iter_tasks_paged(page_size=tamanho_bloco):
+                    objeto = json.dumps(tarefa.para_dict(CAMPOS_EXPORTACAO), ensure_ascii=False, indent=4)
+                    f.write(separador + '    ' + objeto.replace('\n', '\n    '))
+                    separador = ',\n'
+                f.write('\n]' if separador != '\n' else ']')
             return True
         except Exception as e:
             print(f"Erro ao exportar JSON: {str(e)}")
             raise
 
-    def exportar_para_csv(self, filename, pasta_personalizada=False):
+    def exportar_para_csv(self, filename, pasta_personalizada=False, tamanho_bloco=500):
         """Exporta todas as tarefas para um arquivo CSV"""
         try:
-            tarefas = self.obter_todas_tarefas()
+            tarefas = self.db.iter_tasks_paged(page_size=tamanho_bloco)
             headers = ['ID', 'Título', 'Descrição', 'Categoria', 'Prioridade', 
                       'Estado', 'Data Criação', 'Data Vencimento', 'Data Conclusão']
             
@@ -102,43 +346,72 @@ class TaskManager:
                 writer = csv.writer(f)
                 writer.writerow(headers)
                 for tarefa in tarefas:
-                    writer.writerow([
-                        tarefa[0],  # ID
-                        tarefa[1],  # Título
-                        tarefa[2],  # Descrição
-                        tarefa[3],  # Categoria
-                        tarefa[4],  # Prioridade
-                        tarefa[5],  # Estado
-                        tarefa[6],  # Data Criação
-                        tarefa[7],  # Data Vencimento
-                        tarefa[8]   # Data Conclusão
-                    ])
+                    writer.writerow([getattr(tarefa, campo) for campo in CAMPOS_EXPORTACAO])
             return True
         except Exception as e:
             print(f"Erro ao exportar CSV: {str(e)}")
             raise
 
+    def _classificar_importacao(self, registos):
+        """Classifica os registos importados em novos, duplicados ou em conflito"""
+        # Uma única consulta para todos os ids do ficheiro
+        existentes = self.db.get_tasks_by_ids(r['id'] for r in registos if r['id'] is not None)
+        campos = ('titulo', 'descricao', 'categoria', 'prioridade', 'data_vencimento')
+        
+        novas = []
+        vistas = {}
+        duplicadas = 0
+        conflitos = 0
+        for registo in registos:
+            if registo['id'] in existentes:
+                linha = existentes[registo['id']]
+                atual = linha.para_dict(campos)
+            elif registo['id'] in vistas:
+                # O mesmo id repetido dentro do próprio ficheiro
+                atual = vistas[registo['id']]
+            else:
+                if registo['id'] is not None:
+                    vistas[registo['id']] = registo
+                novas.append(registo)
+                continue
+            
+            if all((atual[campo] or '') == (registo[campo] or '') for campo in campos):
+                duplicadas += 1
+            else:
+                conflitos += 1
+        
+        return novas, {'novas': len(novas), 'duplicadas': duplicadas, 'conflitos': conflitos}
+
+    @staticmethod
+    def _converter_id(valor):
+        """Converte o id lido de um ficheiro, ou None se não for válido"""
+        try:
+            return int(valor)
+        except (TypeError, ValueError):
+            return None
+
     def importar_de_json(self, filename, pasta_personalizada=False):
-        """Importa tarefas de um arquivo JSON"""
+        """Importa tarefas de um arquivo JSON e retorna a contagem de novas, duplicadas e em conflito"""
         try:
             if not pasta_personalizada:
                 filename = f'data/{filename}.json'
                 
             with open(filename, 'r', encoding='utf-8') as f:
                 dados = json.load(f)
-                for tarefa in dados:
-                    # Verifica se a tarefa já existe pelo ID
-                    tarefas_existentes = self.db.get_tasks_by_filter(id=tarefa['id'])
-                    if not tarefas_existentes:
-                        self.criar_tarefa(
-                            titulo=tarefa['titulo'],
-                            descricao=tarefa.get('descricao', ''),
-                            categoria=tarefa.get('categoria', ''),
-                            prioridade=tarefa.get('prioridade', 'Média'),
-                            data_vencimento=tarefa.get('data_vencimento', ''),
-                            parent_id=tarefa.get('parent_id')
-                        )
-            return True
+            
+            registos = [{
+                'id': self._converter_id(tarefa.get('id')),
+                'titulo': tarefa['titulo'],
+                'descricao': tarefa.get('descricao', ''),
+                'categoria': tarefa.get('categoria', ''),
+                'prioridade': tarefa.get('prioridade', 'Média'),
+                'data_vencimento': tarefa.get('data_vencimento', ''),
+                'parent_id': tarefa.get('parent_id')
+            } for tarefa in dados]
+            
+            novas, resumo = self._classificar_importacao(registos)
+            self.criar_tarefas_em_lote(novas)
+            return resumo
         except FileNotFoundError:
             print("Arquivo JSON não encontrado")
             raise
@@ -147,26 +420,26 @@ class TaskManager:
             raise
 
     def importar_de_csv(self, filename, pasta_personalizada=False):
-        """Importa tarefas de um arquivo CSV"""
+        """Importa tarefas de um arquivo CSV e retorna a contagem de novas, duplicadas e em conflito"""
         try:
             if not pasta_personalizada:
                 filename = f'data/{filename}.csv'
                 
             with open(filename, 'r', encoding='utf-8') as f:
                 reader = csv.DictReader(f)
-                for row in reader:
-                    # Verifica se a tarefa já existe pelo ID
-                    tarefas_existentes = self.db.get_tasks_by_filter(id=row['ID'])
-                    if not tarefas_existentes:
-                        self.criar_tarefa(
-                            titulo=row['Título'],
-                            descricao=row['Descrição'],
-                            categoria=row['Categoria'],
-                            prioridade=row['Prioridade'],
-                            data_vencimento=row['Data Vencimento'],
-                            parent_id=row.get('Parent ID')
-                        )
-            return True
+                registos = [{
+                    'id': self._converter_id(row.get('ID')),
+                    'titulo': row['Título'],
+                    'descricao': row['Descrição'],
+                    'categoria': row['Categoria'],
+                    'prioridade': row['Prioridade'],
+                    'data_vencimento': row['Data Vencimento'],
+                    'parent_id': row.get('Parent ID')
+                } for row in reader]
+            
+            novas, resumo = self._classificar_importacao(registos)
+            self.criar_tarefas_em_lote(novas)
+            return resumo
         except FileNotFoundError:
             print("Arquivo CSV não encontrado")
             raise
@@ -178,6 +451,14 @@ class TaskManager:
         """Retorna todas as subtarefas de uma tarefa"""
         return self.db.get_subtasks(task_id)
 
+    def obter_ordem_subtarefas(self, parent_id=None, coluna=None, reverso=False):
+        """Retorna os pares (id, tem_subtarefas) dos filhos de uma tarefa, ou das tarefas principais"""
+        return self.db.get_subtask_order(parent_id, order_by=coluna, reverse=reverso)
+
+    def obter_tarefas_por_ids(self, ids, colunas=None):
+        """Retorna as tarefas com os ids indicados, num dicionário por id"""
+        return self.db.get_tasks_by_ids(ids, columns=colunas)
+
     def tem_subtarefas(self, task_id):
         """Verifica se uma tarefa tem subtarefas"""
         return self.db.has_subtasks(task_id) 
\ No newline at end of file